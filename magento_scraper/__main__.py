@@ -0,0 +1,317 @@
+"""
+Lightweight entry point for short, frequent crawls:
+
+    python -m magento_scraper -o output/products.json --no-images
+
+Runs the magento spider without the ``scrapy`` command line (which
+imports every command), leaves the image pipeline unimported unless
+images are wanted, and reports how long start-up took.
+
+For offline load tests, ``--mock-store`` crawls a local synthetic store
+(see ``magento_scraper.mockstore``) started in a separate process:
+
+    python -m magento_scraper --mock-store 100000 -m latency=0.02 --no-images --benchmark
+
+``--frontier-footprint N`` schedules N synthetic product requests without
+crawling and prints the memory they take per request as JSON.
+
+``--parse-benchmark N`` parses N mock store product pages with and without
+fragment parsing and prints the time per page of each as JSON.
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import os
+import sys
+import json
+import argparse
+import logging
+import subprocess
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+FEED_FORMATS = {'.json': 'json', '.jsonl': 'jsonlines', '.jl': 'jsonlines', '.csv': 'csv', '.xml': 'xml'}
+
+
+def _key_value(text):
+    """Parse a NAME=VALUE command line argument."""
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got '{text}'")
+    return name, value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m magento_scraper',
+        description='Run the magento spider with a fast cold start.',
+    )
+    parser.add_argument('-o', '--output', help='feed output file; format from its extension')
+    parser.add_argument('-a', dest='spider_args', action='append', default=[], type=_key_value,
+                        metavar='NAME=VALUE', help='spider argument (may be repeated)')
+    parser.add_argument('-s', dest='settings', action='append', default=[], type=_key_value,
+                        metavar='NAME=VALUE', help='setting override (may be repeated)')
+    parser.add_argument('--stores', help='store configuration file (JSON or YAML)')
+    parser.add_argument('--no-images', action='store_true',
+                        help='do not download images (the image pipeline is never imported)')
+    parser.add_argument('--startup-benchmark', action='store_true',
+                        help='stop after the first response and print start-up timings as JSON')
+    parser.add_argument('--mock-store', type=int, metavar='PRODUCTS',
+                        help='crawl a local mock store with this many products instead')
+    parser.add_argument('-m', dest='mock_options', action='append', default=[], type=_key_value,
+                        metavar='NAME=VALUE',
+                        help='mock store option, e.g. latency=0.05, error_rate=0.01, burst_every=500')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='print crawl throughput as JSON when the crawl ends')
+    parser.add_argument('--frontier-footprint', type=int, metavar='REQUESTS',
+                        help='schedule this many synthetic product requests, print their memory use and exit')
+    parser.add_argument('--parse-benchmark', type=int, metavar='PAGES',
+                        help='parse this many mock product pages with and without fragment parsing, print timings and exit')
+    return parser.parse_args(argv)
+
+
+# Settings for crawling a local mock store as fast as it can serve
+MOCK_STORE_SETTINGS = {
+    'HTTPCACHE_ENABLED': False,
+    'AUTOTHROTTLE_ENABLED': False,
+    'DOWNLOAD_DELAY': 0,
+    'CONCURRENT_REQUESTS': 32,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+}
+
+
+def start_mock_store(products, options):
+    """Start the mock store in a child process and return it with its URL."""
+    command = [sys.executable, '-m', 'magento_scraper.mockstore', '--port', '0', '--products', str(products)]
+    for name, value in options:
+        flag = f"--{name.replace('_', '-')}"
+        if value.lower() in ('true', 'yes', 'on'):
+            command.append(flag)  # e.g. -m tls=true
+        elif value.lower() not in ('false', 'no', 'off'):
+            command += [flag, value]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.wait()
+        raise SystemExit(f"Mock store failed to start (exit code {process.returncode})")
+    return process, url
+
+
+def throughput(stats):
+    """Summarize crawl stats as throughput figures."""
+    elapsed = (stats['finish_time'] - stats['start_time']).total_seconds()
+    products = stats.get('product_pages/fragments', 0) + stats.get('product_pages/full_tree', 0)
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'responses': stats.get('response_received_count', 0),
+        'items': stats.get('item_scraped_count', 0),
+        'products': products,
+        'products_per_second': round(products / elapsed, 2) if elapsed else None,
+        'retries': stats.get('retry/count', 0),
+        'status_counts': {
+            key.rsplit('/', 1)[1]: value for key, value in stats.items()
+            if key.startswith('downloader/response_status_count/')
+        },
+        'peak_rss': stats.get('memory_budget/peak_rss'),
+        'throttled': stats.get('memory_budget/throttled', 0),
+        'spilled': stats.get('scheduler/spilled', 0),
+    }
+
+
+def frontier_footprint(crawler, count, spider_args):
+    """
+    Schedule ``count`` product requests, as the spider's listings would,
+    through the configured scheduler and dupefilter, and return the memory
+    they take as measured by tracemalloc.
+    """
+    import gc
+    import tracemalloc
+    from scrapy.utils.misc import load_object
+
+    crawler.spider = crawler._create_spider(**spider_args)
+    crawler._apply_settings()
+    spider = crawler.spider
+    scheduler = load_object(crawler.settings['SCHEDULER']).from_crawler(crawler)
+    scheduler.open(spider)
+
+    store = spider.default_store
+    base = store.start_urls[0].rstrip('/')
+    listings = []
+    for number in range(50):
+        category_url = f'{base}/category-{number // 10}/listing-{number}.html'
+        category_id = spider.category_contexts.intern(
+            category=f'Listing {number}',
+            parent_category=f'Category {number // 10}',
+            breadcrumbs=(f'Category {number // 10}', f'Listing {number}'),
+        )
+        listings.append((category_id, category_url))
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for number in range(count):
+        category_id, category_url = listings[number % len(listings)]
+        request = spider.product_request(f'{base}/product-{number}.html', store, category_id, category_url)
+        scheduler.enqueue_request(request)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    fingerprints = getattr(scheduler.df, 'fingerprints', ())
+    dupefilter = sys.getsizeof(fingerprints) + sum(sys.getsizeof(fp) for fp in fingerprints)
+    pending = len(scheduler)
+    scheduler.close('finished')
+    return {
+        'requests': pending,
+        'frontier_mb': round(used / 2 ** 20, 1),
+        'bytes_per_request': round(used / pending) if pending else None,
+        'dupefilter_bytes_per_request': round(dupefilter / pending) if pending else None,
+        'dupefilter': f"{type(scheduler.df).__module__}.{type(scheduler.df).__name__}",
+    }
+
+
+def parse_benchmark(process, count, spider_args):
+    """
+    Render ``count`` product pages of a mock catalog and run
+    ``parse_product`` over them with fragment parsing on and off. Returns
+    the time per page of both, how many pages still needed the full tree
+    with fragment parsing on, and whether both gave the same items.
+    """
+    from scrapy import Request
+    from scrapy.http import HtmlResponse
+    from itemadapter import ItemAdapter
+    from .mockstore import MockCatalog, render_product
+
+    catalog = MockCatalog(products=count)
+    base_url = 'http://mock.test'
+    pages = []
+    for product_id in range(count):
+        product = catalog.product(product_id)
+        pages.append((f"{base_url}/{product['slug']}.html", render_product(catalog, product, base_url).encode()))
+
+    result = {'pages': count, 'page_bytes': sum(len(body) for _, body in pages) // count}
+    items = {}
+    for mode, enabled in (('fragments', True), ('full_tree', False)):
+        process.settings.set('FRAGMENT_PARSING_ENABLED', enabled, priority='cmdline')
+        crawler = process.create_crawler('magento')
+        crawler.spider = crawler._create_spider(**spider_args)
+        crawler._apply_settings()
+        spider = crawler.spider
+        store = spider.default_store.name
+        responses = [
+            HtmlResponse(url, body=body, encoding='utf-8', request=Request(url, meta={'store': store}))
+            for url, body in pages
+        ]
+
+        started = time.perf_counter()
+        parsed = [item for response in responses for item in spider.parse_product(response)]
+        elapsed = time.perf_counter() - started
+
+        items[mode] = [
+            {key: value for key, value in ItemAdapter(item).items() if key != 'timestamp'} for item in parsed
+        ]
+        result[f'{mode}_ms_per_page'] = round(elapsed * 1000 / count, 3)
+        if enabled:
+            result['fragment_pages'] = crawler.stats.get_value('product_pages/fragments', 0)
+            result['full_tree_pages'] = crawler.stats.get_value('product_pages/full_tree', 0)
+
+    result['speedup'] = round(result['full_tree_ms_per_page'] / result['fragments_ms_per_page'], 2)
+    result['same_items'] = items['fragments'] == items['full_tree']
+    return result
+
+
+class StartupTimer:
+    """Record import, engine start and first-request times in crawl stats."""
+
+    def __init__(self, crawler, imported_at):
+        self.crawler = crawler
+        self.timings = {'import_seconds': imported_at - STARTED}
+        from scrapy import signals
+        crawler.signals.connect(self.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+
+    def engine_started(self):
+        self._record('engine_started_seconds')
+
+    def request_reached_downloader(self, request, spider):
+        if 'time_to_first_request' not in self.timings:
+            self._record('time_to_first_request')
+
+    def _record(self, name):
+        self.timings[name] = time.perf_counter() - STARTED
+        for key, value in self.timings.items():
+            self.crawler.stats.set_value(f'startup/{key}', round(value, 4))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'magento_scraper.settings')
+
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    imported_at = time.perf_counter()
+
+    settings = get_project_settings()
+    if args.no_images:
+        pipelines = {
+            path: order for path, order in settings.getdict('ITEM_PIPELINES').items()
+            if not path.endswith('ImagesPipeline')
+        }
+        settings.set('ITEM_PIPELINES', pipelines, priority='cmdline')
+    if args.output:
+        feed_format = FEED_FORMATS.get(Path(args.output).suffix.lower(), 'jsonlines')
+        settings.set('FEEDS', {args.output: {'format': feed_format}}, priority='cmdline')
+    if args.startup_benchmark:
+        settings.set('CLOSESPIDER_PAGECOUNT', 1, priority='cmdline')
+    if args.mock_store:
+        for name, value in MOCK_STORE_SETTINGS.items():
+            settings.set(name, value, priority='cmdline')
+    for name, value in args.settings:
+        settings.set(name, value, priority='cmdline')
+
+    spider_args = dict(args.spider_args)
+    if args.stores:
+        spider_args['stores'] = args.stores
+
+    mock_process = None
+    if args.mock_store:
+        from .mockstore import CATEGORIES
+        from .stores import StoreConfig
+        mock_process, url = start_mock_store(args.mock_store, args.mock_options)
+        spider_args['stores'] = [StoreConfig(
+            name='mock',
+            start_urls=[f'{url}/'],
+            categories={segment: name for segment, name, _ in CATEGORIES},
+        )]
+        logger.info(f"Crawling mock store at {url} ({args.mock_store} products)")
+
+    process = CrawlerProcess(settings)
+    if args.parse_benchmark:
+        print(json.dumps(parse_benchmark(process, args.parse_benchmark, spider_args)))
+        return 0
+    crawler = process.create_crawler('magento')
+    if args.frontier_footprint:
+        print(json.dumps(frontier_footprint(crawler, args.frontier_footprint, spider_args)))
+        return 0
+    timer = StartupTimer(crawler, imported_at)
+    process.crawl(crawler, **spider_args)
+    try:
+        process.start()
+    finally:
+        if mock_process is not None:
+            mock_process.terminate()
+            mock_process.wait()
+
+    timings = ', '.join(f"{name} {value:.3f}s" for name, value in timer.timings.items())
+    logger.info(f"Start-up: {timings}")
+    if args.startup_benchmark:
+        print(json.dumps({name: round(value, 4) for name, value in timer.timings.items()}))
+    if args.benchmark:
+        print(json.dumps(throughput(crawler.stats.get_stats())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
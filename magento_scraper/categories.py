@@ -0,0 +1,388 @@
+import copy
+import json
+import logging
+from pathlib import Path
+from urllib.parse import urlparse
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from .checkpoint import checkpoint_saving, load_checkpoint
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_path(url):
+    """
+    Return the canonical category path of a URL, e.g.
+    'https://host/women/tops-women.html?p=2' -> 'women/tops-women'.
+    """
+    path = urlparse(url).path.lower().strip('/')
+    if path.endswith('.html'):
+        path = path[:-len('.html')]
+    return path
+
+
+class CategoryNode:
+    """A category in the tree, with its direct product members."""
+
+    def __init__(self, path, name='', url='', parent=None):
+        self.path = path
+        self.name = name
+        self.url = url
+        self.parent = parent
+        self.children = set()
+        self.products = set()
+        self.previous_products = set()
+        self.change_rate = 0.0
+        self.seen = False
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'url': self.url,
+            'parent': self.parent,
+            'products': sorted(self.products),
+            'change_rate': round(self.change_rate, 4),
+        }
+
+    def __repr__(self):
+        return f"<CategoryNode {self.path} ({len(self.products)} products)>"
+
+
+class CategoryTree:
+    """
+    Category tree of one store keyed by canonical URL path, so categories
+    with the same name under different parents (e.g. 'Tops') stay apart.
+
+    Built incrementally while crawling. ``start_run`` sets the current
+    membership aside so that ``finish_run`` can track the share of products
+    that changed per category as an exponentially weighted change rate.
+    """
+
+    def __init__(self, smoothing=0.5):
+        self.smoothing = smoothing
+        self.nodes = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, path):
+        return path in self.nodes
+
+    def get(self, path):
+        return self.nodes.get(path)
+
+    def _node(self, path):
+        node = self.nodes.get(path)
+        if node is None:
+            node = self.nodes[path] = CategoryNode(path)
+        return node
+
+    def _link(self, node, parent_path):
+        if node.parent == parent_path:
+            return
+        if node.parent in self.nodes:
+            self.nodes[node.parent].children.discard(node.path)
+        node.parent = parent_path
+        if parent_path:
+            self._node(parent_path).children.add(node.path)
+
+    def add_category(self, url, name='', parent_url=None):
+        """Add or update a category; the parent defaults to the URL's directory."""
+        path = canonical_path(url)
+        if not path:
+            return None
+        node = self._node(path)
+        node.name = name or node.name
+        node.url = url or node.url
+        node.seen = True
+
+        if parent_url:
+            parent = canonical_path(parent_url)
+        else:
+            parent = path.rpartition('/')[0] or None
+        self._link(node, parent if parent != path else None)
+        return node
+
+    def add_product(self, category_url, product_key):
+        """Record that a product is listed in a category."""
+        path = canonical_path(category_url)
+        if not path:
+            return
+        node = self._node(path)
+        if node.parent is None and '/' in path:
+            self._link(node, path.rpartition('/')[0])
+        node.seen = True
+        node.products.add(product_key)
+
+    def level(self, path):
+        """Depth of a category: 0 for top-level categories."""
+        level = 0
+        node = self.nodes.get(path)
+        while node is not None and node.parent:
+            level += 1
+            node = self.nodes.get(node.parent)
+        return level
+
+    def roots(self):
+        return sorted(path for path, node in self.nodes.items() if not node.parent)
+
+    def subtree(self, path):
+        """Yield the nodes of the subtree rooted at ``path``."""
+        stack = [path]
+        while stack:
+            node = self.nodes.get(stack.pop())
+            if node is None:
+                continue
+            yield node
+            stack.extend(node.children)
+
+    def products(self, path, recursive=True):
+        """Return the products listed in a category (and its descendants)."""
+        if not recursive:
+            node = self.nodes.get(path)
+            return set(node.products) if node else set()
+        members = set()
+        for node in self.subtree(path):
+            members |= node.products
+        return members
+
+    def count(self, path, recursive=True):
+        return len(self.products(path, recursive))
+
+    def categories_of(self, product_key):
+        """Return the paths of the categories a product is listed in."""
+        return sorted(path for path, node in self.nodes.items() if product_key in node.products)
+
+    def export_subtree(self, path):
+        """Return a nested dict of the subtree with names, URLs and counts."""
+        node = self.nodes.get(path)
+        if node is None:
+            return None
+        return {
+            'path': node.path,
+            'name': node.name,
+            'url': node.url,
+            'level': self.level(path),
+            'product_count': len(node.products),
+            'subtree_product_count': self.count(path),
+            'change_rate': round(node.change_rate, 4),
+            'children': [self.export_subtree(child) for child in sorted(node.children)],
+        }
+
+    def start_run(self):
+        """Keep the current membership as last run's and start over."""
+        for node in self.nodes.values():
+            node.previous_products = node.products
+            node.products = set()
+            node.seen = False
+
+    def finish_run(self, complete=True):
+        """
+        Fold this run's membership changes into the change rate of every
+        visited category seen in an earlier run. An incomplete run only saw part of each listing,
+        so it adds to last run's membership instead. Categories not visited
+        keep last run's membership either way.
+        """
+        for node in self.nodes.values():
+            if not node.seen or not complete:
+                node.products |= node.previous_products
+                continue
+            if not node.previous_products:
+                # First sighting, nothing to compare against yet
+                continue
+            union = node.products | node.previous_products
+            changed = len(node.products ^ node.previous_products) / len(union) if union else 0.0
+            node.change_rate = self.smoothing * changed + (1 - self.smoothing) * node.change_rate
+
+    def recrawl_candidates(self, limit=10):
+        """
+        Rank subtrees by how many product memberships are expected to change,
+        i.e. the sum of change rate times size over the subtree.
+        """
+        scores = []
+        for path in self.nodes:
+            score = sum(node.change_rate * len(node.products) for node in self.subtree(path))
+            if score > 0:
+                scores.append((score, path))
+        scores.sort(reverse=True)
+        return [path for _, path in scores[:limit]]
+
+    def to_dict(self):
+        return {path: node.to_dict() for path, node in sorted(self.nodes.items())}
+
+    @classmethod
+    def from_dict(cls, data, smoothing=0.5):
+        """Rebuild a tree saved with ``to_dict``."""
+        tree = cls(smoothing)
+        for path, entry in data.items():
+            node = tree._node(path)
+            node.name = entry.get('name', '')
+            node.url = entry.get('url', '')
+            node.products = set(entry.get('products', ()))
+            node.change_rate = entry.get('change_rate', 0.0)
+            tree._link(node, entry.get('parent'))
+        return tree
+
+
+class CategoryContext:
+    """Where a listing sits in the store's menu: names and breadcrumbs."""
+
+    __slots__ = ('category', 'parent_category', 'subcategory', 'nested_category', 'breadcrumbs')
+
+    def __init__(self, category='', parent_category='', subcategory='', nested_category='', breadcrumbs=()):
+        self.category = category
+        self.parent_category = parent_category
+        self.subcategory = subcategory
+        self.nested_category = nested_category
+        self.breadcrumbs = tuple(breadcrumbs)
+
+    def key(self):
+        return (self.category, self.parent_category, self.subcategory, self.nested_category, self.breadcrumbs)
+
+    def __repr__(self):
+        return f"<CategoryContext {' > '.join(self.breadcrumbs) or self.category}>"
+
+
+class CategoryContexts:
+    """
+    Interning table of category contexts. Requests carry the small integer
+    id of their context in ``meta['category_id']`` instead of their own
+    names and breadcrumb lists, so a million pending requests of a few
+    hundred categories share a few hundred contexts.
+    """
+
+    EMPTY = CategoryContext()
+
+    def __init__(self):
+        self.contexts = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def intern(self, category='', parent_category='', subcategory='', nested_category='', breadcrumbs=()):
+        """Return the id of a context, adding it on first use."""
+        context = CategoryContext(category, parent_category, subcategory, nested_category, breadcrumbs)
+        key = context.key()
+        context_id = self.ids.get(key)
+        if context_id is None:
+            context_id = self.ids[key] = len(self.contexts)
+            self.contexts.append(context)
+        return context_id
+
+    def get(self, context_id):
+        """Return the context of an id; unknown ids give an empty context."""
+        if context_id is None or not 0 <= context_id < len(self.contexts):
+            return self.EMPTY
+        return self.contexts[context_id]
+
+    def __getstate__(self):
+        # Ids are positions, the lookup dict is rebuilt on load
+        return [context.key() for context in self.contexts]
+
+    def __setstate__(self, keys):
+        self.contexts = []
+        self.ids = {}
+        for key in keys:
+            self.intern(*key)
+
+
+def load_category_trees(path, smoothing=0.5):
+    """Load the per-store trees saved by ``save_category_trees``."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding='utf-8'))
+    return {
+        store: CategoryTree.from_dict(nodes, smoothing)
+        for store, nodes in data.get('stores', {}).items()
+    }
+
+
+def save_category_trees(path, trees):
+    """Persist per-store trees as JSON."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {'stores': {store: tree.to_dict() for store, tree in sorted(trees.items())}}
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding='utf-8')
+    tmp_path.replace(path)
+
+
+class CategoryIndex:
+    """
+    Extension that keeps the spider's per-store category trees across runs:
+    loads them when the spider opens, saves them (and the subtrees most
+    worth recrawling) when it closes, and includes them in crawl checkpoints.
+
+    The spider fills the trees while crawling, as products are only requested
+    once even when listed in several categories.
+    """
+
+    def __init__(self, stats, path, smoothing=0.5, checkpoint_dir=None):
+        self.stats = stats
+        self.path = Path(path)
+        self.smoothing = smoothing
+        self.checkpoint_dir = checkpoint_dir
+        self.trees = None
+        self.closed_state = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create extension instance from crawler."""
+        path = crawler.settings.get('CATEGORY_TREE_PATH')
+        if not path:
+            raise NotConfigured
+        ext = cls(
+            stats=crawler.stats,
+            path=path,
+            smoothing=crawler.settings.getfloat('CATEGORY_TREE_SMOOTHING', 0.5),
+            checkpoint_dir=crawler.settings.get('CHECKPOINT_DIR'),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        if ext.checkpoint_dir:
+            crawler.signals.connect(ext.checkpoint_saving, signal=checkpoint_saving)
+        return ext
+
+    def spider_opened(self, spider):
+        """Hand the saved (or checkpointed) trees to the spider."""
+        if not hasattr(spider, 'category_trees'):
+            return
+        checkpoint = load_checkpoint(self.checkpoint_dir)
+        state = checkpoint['components'].get(self.__class__.__name__) if checkpoint else None
+        if state is not None:
+            self.trees = state
+        else:
+            self.trees = load_category_trees(self.path, self.smoothing)
+            for tree in self.trees.values():
+                tree.start_run()
+        spider.category_trees = self.trees
+        if self.trees:
+            logger.info(
+                f"Loaded category trees from {self.path}: "
+                + ', '.join(f"{store} ({len(tree)} categories)" for store, tree in self.trees.items())
+            )
+
+    def checkpoint_saving(self, spider):
+        """Return the trees as they stand for a crawl checkpoint."""
+        if self.trees is None:
+            # The final checkpoint is written after the trees are saved
+            return self.closed_state
+        return {self.__class__.__name__: self.trees}
+
+    def spider_closed(self, spider, reason):
+        """Fold in this run's changes and persist the trees."""
+        if self.trees is None:
+            return
+        if self.checkpoint_dir:
+            # finish_run() changes the trees; a resumed crawl needs them as they were
+            self.closed_state = {self.__class__.__name__: copy.deepcopy(self.trees)}
+        for store, tree in self.trees.items():
+            tree.finish_run(complete=(reason == 'finished'))
+            self.stats.set_value(f'category_tree/{store}/categories', len(tree))
+            candidates = tree.recrawl_candidates(limit=5)
+            if candidates:
+                logger.info(f"Subtrees of {store} most worth recrawling: {', '.join(candidates)}")
+        save_category_trees(self.path, self.trees)
+        self.trees = None
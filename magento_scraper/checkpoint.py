@@ -0,0 +1,234 @@
+import os
+import zlib
+import pickle
+import logging
+from collections import Counter
+from pathlib import Path
+from itemadapter import is_item
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.request import request_from_dict
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'checkpoint.bin'
+
+# Sent before every checkpoint is written. Receivers get ``spider`` and return
+# a dict of ``{component_name: state}`` to be stored alongside the frontier.
+checkpoint_saving = object()
+
+
+def load_checkpoint(directory):
+    """Load the last checkpoint from ``directory``, or None if there is none."""
+    if not directory:
+        return None
+    path = Path(directory) / CHECKPOINT_FILE
+    if not path.exists():
+        return None
+    try:
+        state = pickle.loads(zlib.decompress(path.read_bytes()))
+    except (OSError, zlib.error, pickle.UnpicklingError, EOFError) as e:
+        logger.error(f"Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if state.get('finished'):
+        # The previous crawl ran to completion, start a new one
+        return None
+    return state
+
+
+def save_checkpoint(directory, state):
+    """Atomically write ``state`` to ``directory`` so a SIGKILL never leaves a torn file."""
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp_path = path / f'{CHECKPOINT_FILE}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path / CHECKPOINT_FILE)
+
+
+class CheckpointMiddleware:
+    """
+    Spider middleware that periodically persists the crawl frontier, the
+    spider's dedup state and the state of any component listening to
+    ``checkpoint_saving`` (e.g. the exporter offset of MagentoScraperPipeline).
+
+    A request stays in the frontier until its callback has finished and every
+    item it produced has left the item pipelines, so a restart from the last
+    checkpoint re-does at most ``CHECKPOINT_INTERVAL`` seconds of work. The
+    dupefilter's fingerprints are saved too, so requests that were already
+    done are filtered out again when pending listings are re-parsed.
+
+    Requests are counted per fingerprint: a duplicate rejected by the
+    dupefilter, or a second ``dont_filter`` request for the same page, must
+    not end the tracking of the one already in flight.
+    """
+
+    def __init__(self, crawler, directory, interval):
+        self.crawler = crawler
+        self.directory = directory
+        self.interval = interval
+        self.fingerprinter = crawler.request_fingerprinter
+        self.pending = {}
+        self.scheduled = Counter()
+        self.outstanding_items = Counter()
+        self.output_done = Counter()
+        self.start_requests_done = False
+        self.resumed = load_checkpoint(directory)
+        self.spider = None
+        self._task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create middleware instance from crawler."""
+        directory = crawler.settings.get('CHECKPOINT_DIR')
+        if not directory:
+            raise NotConfigured
+        mw = cls(crawler, directory, crawler.settings.getfloat('CHECKPOINT_INTERVAL', 30))
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(mw.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(mw.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(mw.item_finished, signal=signals.item_scraped)
+        crawler.signals.connect(mw.item_finished, signal=signals.item_dropped)
+        crawler.signals.connect(mw.item_finished, signal=signals.item_error)
+        return mw
+
+    def spider_opened(self, spider):
+        """Restore spider state and start the periodic checkpoint task."""
+        self.spider = spider
+        if self.resumed:
+            spider.processed_urls = set(self.resumed.get('processed_urls', ()))
+            if self.resumed.get('category_contexts') is not None:
+                # Pending requests refer to these by id
+                spider.category_contexts = self.resumed['category_contexts']
+            self._restore_dupefilter()
+            logger.info(
+                f"Resuming crawl from {self.directory}: "
+                f"{len(self.resumed['frontier'])} pending requests"
+            )
+        self._task = task.LoopingCall(self.save)
+        self._task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        """Write a final checkpoint, marked finished if the crawl completed."""
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        self.save(finished=(reason == 'finished'))
+
+    def process_start_requests(self, start_requests, spider):
+        """Replace the start requests with the saved frontier when resuming."""
+        if self.resumed:
+            df = self._dupefilter()
+            for data in self.resumed['frontier']:
+                request = request_from_dict(data, spider=spider)
+                if hasattr(df, 'fingerprints'):
+                    # Scheduled again, so it must not count as seen
+                    df.fingerprints.discard(df.request_fingerprint(request))
+                yield request
+            if self.resumed.get('start_requests_done'):
+                self.start_requests_done = True
+                return
+
+        for request in start_requests:
+            yield request
+        self.start_requests_done = True
+
+    def process_spider_output(self, response, result, spider):
+        """Count items produced by a response and mark its callback finished."""
+        key = self._key(response.request)
+        for element in result:
+            if is_item(element):
+                self.outstanding_items[key] += 1
+            yield element
+        self._callback_finished(key)
+
+    def process_spider_exception(self, response, exception, spider):
+        """A failed callback will not produce more output for its request."""
+        self._callback_finished(self._key(response.request))
+
+    def request_scheduled(self, request, spider):
+        """Track a request until its output has been fully processed."""
+        key = self._key(request)
+        redirect_urls = request.meta.get('redirect_urls')
+        if redirect_urls:
+            # The redirect replaces the request that led to it
+            self._release(self._key(request.replace(url=redirect_urls[-1])))
+        elif request.meta.get('retry_times'):
+            # A retry replaces the failed attempt
+            self._release(key)
+        self.scheduled[key] += 1
+        # A duplicate must not replace the request already being tracked
+        self.pending.setdefault(key, request)
+
+    def request_dropped(self, request, spider):
+        """Requests rejected by the scheduler are not part of the frontier."""
+        self._release(self._key(request))
+
+    def item_finished(self, item, response, spider, **kwargs):
+        """Called when an item leaves the pipelines (scraped, dropped or failed)."""
+        if response is None:
+            return
+        key = self._key(response.request)
+        self.outstanding_items[key] -= 1
+        if self.outstanding_items[key] <= 0:
+            del self.outstanding_items[key]
+            for _ in range(self.output_done.pop(key, 0)):
+                self._release(key)
+
+    def save(self, finished=False):
+        """Persist the frontier and component state."""
+        if self.spider is None:
+            return
+        state = {
+            'finished': finished,
+            'start_requests_done': self.start_requests_done,
+            'frontier': [r.to_dict(spider=self.spider) for r in self.pending.values()],
+            'processed_urls': list(getattr(self.spider, 'processed_urls', ())),
+            'seen_fingerprints': list(getattr(self._dupefilter(), 'fingerprints', ())),
+            'category_contexts': getattr(self.spider, 'category_contexts', None),
+            'components': {},
+        }
+        for _, result in self.crawler.signals.send_catch_log(
+            signal=checkpoint_saving, spider=self.spider
+        ):
+            if isinstance(result, dict):
+                state['components'].update(result)
+
+        save_checkpoint(self.directory, state)
+        self.crawler.stats.inc_value('checkpoint/saved')
+        self.crawler.stats.set_value('checkpoint/frontier_size', len(state['frontier']))
+        logger.debug(f"Checkpoint saved: {len(state['frontier'])} pending requests")
+
+    def _callback_finished(self, key):
+        """Drop a request from the frontier once its items are also done."""
+        if self.outstanding_items.get(key, 0) > 0:
+            self.output_done[key] += 1
+        else:
+            self._release(key)
+
+    def _release(self, key):
+        """Forget one scheduled request for ``key``, and the key with the last one."""
+        self.scheduled[key] -= 1
+        if self.scheduled[key] <= 0:
+            del self.scheduled[key]
+            self.pending.pop(key, None)
+
+    def _dupefilter(self):
+        """Return the scheduler's dupefilter, if the scheduler has one."""
+        slot = getattr(self.crawler.engine, 'slot', None)
+        return getattr(getattr(slot, 'scheduler', None), 'df', None)
+
+    def _restore_dupefilter(self):
+        """Mark the requests that were done before the checkpoint as seen."""
+        df = self._dupefilter()
+        fingerprints = self.resumed.get('seen_fingerprints')
+        if fingerprints and hasattr(df, 'fingerprints'):
+            df.fingerprints.update(fingerprints)
+            logger.info(f"Restored {len(fingerprints)} seen request fingerprints")
+
+    def _key(self, request):
+        """Return the frontier key (request fingerprint) for a request."""
+        return self.fingerprinter.fingerprint(request)
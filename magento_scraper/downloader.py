@@ -0,0 +1,318 @@
+"""
+Download path tuned for many small requests to a few hosts: persistent
+HTTP/2 connections where the server negotiates them, keep-alive HTTP/1.1
+pools otherwise, and separate pools for pages and media (images).
+
+Requests choose their class with ``request.meta['download_class']``
+(``'page'`` by default, ``'media'`` for the image pipeline).
+"""
+import logging
+from time import time
+from twisted.internet import defer
+from twisted.internet.defer import CancelledError
+from twisted.python.failure import Failure
+from twisted.web.client import HTTPConnectionPool, ResponseFailed
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.httpobj import urlparse_cached
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLASS = 'page'
+
+
+def _key_host(key):
+    """Return the host of a connection pool key ``(scheme, host, port, ...)``."""
+    host = key[1] if len(key) > 1 else ''
+    return host.decode('ascii', 'replace') if isinstance(host, bytes) else str(host)
+
+
+def slot_key(host, download_class):
+    """Return the download slot of a host for a class of requests."""
+    return host if download_class == DEFAULT_CLASS else f'{host}|{download_class}'
+
+
+def is_http2_negotiation_error(failure):
+    """
+    Return True if an HTTP/2 request failed because the host doesn't speak
+    HTTP/2: an HTTP/2 protocol error (e.g. ALPN picked another protocol, or
+    an HTTP/1.1 answer to the connection preface) or a TLS
+    ``no_application_protocol`` alert. Timeouts, DNS errors, refused or
+    reset connections are not.
+    """
+    from h2.exceptions import H2Error
+
+    errors = failure.value.reasons if isinstance(failure.value, ResponseFailed) else [failure.value]
+    for error in errors:
+        if isinstance(error, Failure):
+            error = error.value
+        if isinstance(error, H2Error):
+            return True
+        if type(error).__module__.startswith('OpenSSL') and 'no application protocol' in str(error).lower():
+            return True
+    return False
+
+
+class ConnectionStats:
+    """
+    Records connection use in the crawl stats, per class of request:
+    ``connections/<class>/requests``, ``new``, ``reuse_ratio``, the average
+    TCP connect time and the average response time on new and on reused
+    connections. Their difference, ``setup_ms``, estimates what opening a
+    connection (TLS handshake included) adds to a request.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.current = None  # (request, download_class) being handed to a pool
+
+    def _prefix(self, download_class):
+        return f'connections/{download_class}'
+
+    def _average(self, name, download_class, value):
+        prefix = self._prefix(download_class)
+        self.stats.inc_value(f'{prefix}/{name}_total_ms', value)
+        self.stats.inc_value(f'{prefix}/{name}_count')
+        average = self.stats.get_value(f'{prefix}/{name}_total_ms') / self.stats.get_value(f'{prefix}/{name}_count')
+        self.stats.set_value(f'{prefix}/{name}_ms', round(average, 2))
+
+    def connection_requested(self, download_class, reused):
+        """Called by a pool when a request asks it for a connection."""
+        prefix = self._prefix(download_class)
+        self.stats.inc_value(f'{prefix}/requests')
+        if not reused:
+            self.stats.inc_value(f'{prefix}/new')
+        new = self.stats.get_value(f'{prefix}/new', 0)
+        requests = self.stats.get_value(f'{prefix}/requests')
+        self.stats.set_value(f'{prefix}/reuse_ratio', round(1 - new / requests, 4))
+        if self.current is not None:
+            self.current[0].meta['connection_reused'] = reused
+
+    def connected(self, download_class, started):
+        self._average('connect', download_class, (time() - started) * 1000)
+
+    def response_received(self, request, download_class, started, protocol):
+        self.stats.inc_value(f'connections/protocol/{protocol}')
+        reused = request.meta.get('connection_reused')
+        if reused is None:
+            return
+        prefix = self._prefix(download_class)
+        self._average('reused_response' if reused else 'new_response', download_class, (time() - started) * 1000)
+        new = self.stats.get_value(f'{prefix}/new_response_ms')
+        reused_ms = self.stats.get_value(f'{prefix}/reused_response_ms')
+        if new is not None and reused_ms is not None:
+            self.stats.set_value(f'{prefix}/setup_ms', round(max(new - reused_ms, 0), 2))
+
+
+class InstrumentedHTTPConnectionPool(HTTPConnectionPool):
+    """
+    Keep-alive HTTP/1.1 pool that reports reuse to ``ConnectionStats`` and
+    keeps as many idle connections per host as its download slot may use.
+    """
+
+    def __init__(self, reactor, connection_stats, download_class, size, host_sizes=None):
+        super().__init__(reactor, persistent=True)
+        self._factory.noisy = False
+        self.connection_stats = connection_stats
+        self.download_class = download_class
+        self.maxPersistentPerHost = size
+        self.default_size = size
+        self.host_sizes = host_sizes or {}
+
+    def getConnection(self, key, endpoint):
+        reused = any(c.state == 'QUIESCENT' for c in self._connections.get(key, ()))
+        self.connection_stats.connection_requested(self.download_class, reused)
+        return super().getConnection(key, endpoint)
+
+    def _newConnection(self, key, endpoint):
+        started = time()
+        d = super()._newConnection(key, endpoint)
+
+        def connected(connection):
+            self.connection_stats.connected(self.download_class, started)
+            return connection
+
+        return d.addCallback(connected)
+
+    def _putConnection(self, key, connection):
+        # maxPersistentPerHost is only read here, so it can vary per host
+        host = slot_key(_key_host(key), self.download_class)
+        self.maxPersistentPerHost = self.host_sizes.get(host, self.default_size)
+        super()._putConnection(key, connection)
+
+
+def _instrumented_h2_pool_class():
+    """Return the HTTP/2 pool class; imported on demand as it needs ``h2``."""
+    from scrapy.core.http2.agent import H2ConnectionPool
+
+    class InstrumentedH2ConnectionPool(H2ConnectionPool):
+        """HTTP/2 pool (one multiplexed connection per host) reporting reuse."""
+
+        def __init__(self, reactor, settings, connection_stats, download_class):
+            super().__init__(reactor, settings)
+            self.connection_stats = connection_stats
+            self.download_class = download_class
+            self._connecting = {}
+
+        def get_connection(self, key, uri, endpoint):
+            reused = key in self._connections or key in self._pending_requests
+            self.connection_stats.connection_requested(self.download_class, reused)
+            return super().get_connection(key, uri, endpoint)
+
+        def _new_connection(self, key, uri, endpoint):
+            self._connecting[key] = time()
+            return super()._new_connection(key, uri, endpoint)
+
+        def put_connection(self, conn, key):
+            started = self._connecting.pop(key, None)
+            if started is not None:
+                self.connection_stats.connected(self.download_class, started)
+            return super().put_connection(conn, key)
+
+    return InstrumentedH2ConnectionPool
+
+
+class AdaptiveHTTPDownloadHandler:
+    """
+    Download handler for http and https that uses HTTP/2 for https hosts
+    that negotiate it and falls back to keep-alive HTTP/1.1 for the rest.
+
+    The first HTTP/2 request to a host is a probe: if the host turns out
+    not to speak HTTP/2 (see ``is_http2_negotiation_error``), it is
+    remembered as HTTP/1.1-only and the request is retried over HTTP/1.1
+    right away. Other failures are left to the retry middleware.
+    Scrapy has no cleartext HTTP/2 (h2c) client, so plain http and proxied
+    requests always use HTTP/1.1.
+
+    Every class in ``DOWNLOAD_POOL_SIZES`` gets its own pools, so image
+    downloads never queue for the connections pages are using.
+    """
+
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        from twisted.internet import reactor
+
+        self.crawler = crawler
+        self.connection_stats = ConnectionStats(crawler.stats) if crawler else None
+        self.http2_enabled = settings.getbool('HTTP2_ENABLED', True)
+        self.h1_hosts = set()
+        self.h2_hosts = set()
+
+        per_domain = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        sizes = {DEFAULT_CLASS: per_domain}
+        sizes.update({
+            download_class: size or per_domain
+            for download_class, size in settings.getdict('DOWNLOAD_POOL_SIZES').items()
+        })
+        host_sizes = {
+            key: slot['concurrency'] for key, slot in settings.getdict('DOWNLOAD_SLOTS').items()
+            if slot.get('concurrency')
+        }
+
+        self.http11 = {}
+        self.h2 = {}
+        h2_pool_class = self._h2_pool_class() if self.http2_enabled else None
+        for download_class, size in sizes.items():
+            handler = HTTP11DownloadHandler(settings, crawler)
+            # The stock handler has no hook for its pool, replace it
+            handler._pool = InstrumentedHTTPConnectionPool(
+                reactor, self.connection_stats, download_class, size, host_sizes
+            )
+            self.http11[download_class] = handler
+            if h2_pool_class is not None:
+                from scrapy.core.downloader.handlers.http2 import H2DownloadHandler
+                handler = H2DownloadHandler(settings, crawler)
+                handler._pool = h2_pool_class(reactor, settings, self.connection_stats, download_class)
+                self.h2[download_class] = handler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def _h2_pool_class(self):
+        try:
+            return _instrumented_h2_pool_class()
+        except ImportError as e:
+            logger.warning(f"HTTP/2 disabled, install Twisted[http2] to enable it: {e}")
+            self.http2_enabled = False
+            return None
+
+    def download_request(self, request, spider):
+        download_class = request.meta.get('download_class', DEFAULT_CLASS)
+        if download_class not in self.http11:
+            download_class = DEFAULT_CLASS
+        parsed = urlparse_cached(request)
+        host = parsed.hostname
+
+        if (self.h2 and parsed.scheme == 'https' and host not in self.h1_hosts
+                and not request.meta.get('proxy')):
+            d = self._download(self.h2[download_class], request, spider, download_class)
+            if host not in self.h2_hosts:
+                d.addCallbacks(
+                    self._h2_confirmed, self._h2_failed,
+                    callbackArgs=(host,), errbackArgs=(request, spider, download_class, host),
+                )
+            return d
+        return self._download(self.http11[download_class], request, spider, download_class)
+
+    def _download(self, handler, request, spider, download_class):
+        if self.connection_stats is None:
+            return handler.download_request(request, spider)
+
+        started = time()
+        # Pools are asked for a connection synchronously, this tells them which request it is for
+        self.connection_stats.current = (request, download_class)
+        try:
+            d = handler.download_request(request, spider)
+        finally:
+            self.connection_stats.current = None
+
+        def received(response):
+            protocol = (getattr(response, 'protocol', None) or 'unknown').lower()
+            self.connection_stats.response_received(request, download_class, started, protocol)
+            return response
+
+        return d.addCallback(received)
+
+    def _h2_confirmed(self, response, host):
+        self.h2_hosts.add(host)
+        return response
+
+    def _h2_failed(self, failure, request, spider, download_class, host):
+        if failure.check(CancelledError) or host in self.h2_hosts or not is_http2_negotiation_error(failure):
+            return failure
+        if host not in self.h1_hosts:
+            self.h1_hosts.add(host)
+            logger.info(f"{host} did not accept HTTP/2 ({failure.getErrorMessage()}), using HTTP/1.1")
+            if self.crawler is not None:
+                self.crawler.stats.inc_value('connections/http2_fallbacks')
+        return self._download(self.http11[download_class], request, spider, download_class)
+
+    @defer.inlineCallbacks
+    def close(self):
+        for handler in self.h2.values():
+            handler.close()
+        for handler in self.http11.values():
+            yield handler.close()
+
+
+class DownloadClassMiddleware:
+    """
+    Downloader middleware that puts requests of the classes listed in
+    ``DOWNLOAD_CLASS_SLOTS`` (e.g. images) in a download slot of their own
+    per host, so they get their own concurrency and delay and never wait
+    behind page requests. Other requests share the host's slot.
+    """
+
+    def __init__(self, class_slots=()):
+        self.class_slots = set(class_slots)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create middleware instance from crawler."""
+        return cls(crawler.settings.getdict('DOWNLOAD_CLASS_SLOTS'))
+
+    def process_request(self, request, spider):
+        download_class = request.meta.get('download_class', DEFAULT_CLASS)
+        if download_class in self.class_slots and 'download_slot' not in request.meta:
+            request.meta['download_slot'] = slot_key(urlparse_cached(request).hostname, download_class)
@@ -0,0 +1,316 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from pathlib import Path
+from datetime import datetime
+from twisted.internet import task
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def get_rss():
+    """Return the current resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not Linux: fall back to the peak RSS reported by getrusage
+        import resource
+        size = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return size if sys.platform == 'darwin' else size * 1024
+
+
+def _as_bool(value):
+    """Interpret a spider argument or setting value as a boolean."""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+class SamplingProfiler:
+    """
+    Extension that samples the reactor thread's stack at a fixed rate during
+    a crawl and writes a flamegraph-compatible folded-stack file plus a
+    top-N summary when the spider closes.
+
+    Enable it with ``-s PROFILER_ENABLED=True`` or ``-a profile=1``.
+    """
+
+    # Stack frames that mean the reactor is waiting for I/O
+    IDLE_FRAMES = {'select', 'poll', 'epoll', 'doSelect', 'doPoll', 'doIteration'}
+
+    def __init__(self, crawler, enabled=False, interval=0.01, output_dir='profiles', top_n=20):
+        self.crawler = crawler
+        self.enabled = enabled
+        self.interval = interval
+        self.output_dir = Path(output_dir)
+        self.top_n = top_n
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._target_ident = None
+        self._started_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create extension instance from crawler."""
+        settings = crawler.settings
+        ext = cls(
+            crawler,
+            enabled=settings.getbool('PROFILER_ENABLED', False),
+            interval=settings.getfloat('PROFILER_INTERVAL', 0.01),
+            output_dir=settings.get('PROFILER_OUTPUT_DIR', 'profiles'),
+            top_n=settings.getint('PROFILER_TOP_N', 20),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        """Start sampling if enabled by setting or spider argument."""
+        if not (self.enabled or _as_bool(getattr(spider, 'profile', False))):
+            return
+
+        # Signals are delivered on the reactor thread, so this is the one to sample
+        self._target_ident = threading.get_ident()
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, name='magento-profiler', daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({1 / self.interval:.0f} Hz)")
+
+    def spider_closed(self, spider, reason):
+        """Stop sampling and write the folded stacks and summary."""
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.crawler.stats.set_value('profiler/samples', self.samples)
+
+        if not self.samples:
+            logger.warning("Sampling profiler collected no samples")
+            return
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        folded_path = self.output_dir / f'{spider.name}_{timestamp}.folded'
+        summary_path = self.output_dir / f'{spider.name}_{timestamp}_summary.txt'
+
+        with open(folded_path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        summary = self._build_summary()
+        summary_path.write_text(summary, encoding='utf-8')
+
+        logger.info(f"Profile written to {folded_path}")
+        logger.info(f"Profile summary:\n{summary}")
+
+    def _run(self):
+        """Sampling loop executed in a background thread."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_ident)
+            if frame is None:
+                continue
+            self._record(frame)
+
+    def _record(self, frame):
+        """Fold one stack sample into the counters."""
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            module = frame.f_globals.get('__name__', '?')
+            frames.append((module, getattr(code, 'co_qualname', code.co_name)))
+            frame = frame.f_back
+        frames.reverse()
+
+        self.stacks[';'.join(f"{module}:{name}" for module, name in frames)] += 1
+        self.categories[self._classify(frames)] += 1
+        self.samples += 1
+
+    def _classify(self, frames):
+        """Attribute a sample (outermost frame first) to a crawl stage."""
+        callback = None
+        pipeline = None
+        in_json = in_selector = in_pil = False
+
+        for module, name in frames:
+            if module.startswith('magento_scraper.spiders'):
+                callback = name.rsplit('.', 1)[-1]
+            elif module in ('magento_scraper.pipelines', 'magento_scraper.images'):
+                pipeline = name
+            elif module.startswith('PIL'):
+                in_pil = True
+            elif module.startswith('json'):
+                in_json = True
+            elif module.startswith(('parsel', 'lxml', 'scrapy.selector', 'magento_scraper.selector_health',
+                                    'magento_scraper.fragments', 'magento_scraper.xpaths')):
+                # Compiled lxml XPaths add no Python frames of their own
+                in_selector = True
+
+        if in_pil:
+            return 'images (PIL)'
+        if in_json and callback == 'parse_product':
+            return 'json decoding (parse_product)'
+        if in_selector and callback:
+            return f'selectors ({callback})'
+        if pipeline:
+            return f'pipeline ({pipeline})'
+        if callback:
+            return f'callback ({callback})'
+        if frames and frames[-1][1].rsplit('.', 1)[-1] in self.IDLE_FRAMES:
+            return 'idle (waiting for I/O)'
+        return 'other (scrapy/twisted)'
+
+    def _build_summary(self):
+        """Build a plain-text top-N summary of the collected samples."""
+        elapsed = time.monotonic() - self._started_at
+        self_time = Counter()
+        for stack, count in self.stacks.items():
+            self_time[stack.rsplit(';', 1)[-1]] += count
+
+        lines = [
+            f"Samples: {self.samples} over {elapsed:.1f}s "
+            f"(interval {self.interval * 1000:.1f}ms)",
+            "",
+            "Time by crawl stage:",
+        ]
+        for category, count in self.categories.most_common():
+            lines.append(f"  {count / self.samples:7.2%}  {category}")
+
+        lines.extend(["", f"Top {self.top_n} functions by self time:"])
+        for frame, count in self_time.most_common(self.top_n):
+            lines.append(f"  {count / self.samples:7.2%}  {frame}")
+
+        return '\n'.join(lines) + '\n'
+
+
+class MemoryBudget:
+    """
+    Extension that applies backpressure when the process RSS exceeds
+    ``MEMORY_BUDGET_MB``: it pauses scheduling of new downloads, shrinks
+    the item concurrency and spills the queued frontier to disk (when the
+    scheduler is a ``SpillingScheduler``). Normal operation resumes once
+    RSS falls below ``MEMORY_BUDGET_RESUME_RATIO`` of the budget, or once
+    there is no work left in flight to wait for. In the latter case RSS is
+    still over budget, so backpressure is only applied again after
+    ``MEMORY_BUDGET_MIN_RELEASE`` seconds of crawling.
+    """
+
+    def __init__(self, crawler, budget, interval=5.0, resume_ratio=0.85, min_concurrent_items=10,
+                 min_release=10.0):
+        self.crawler = crawler
+        self.budget = budget
+        self.interval = interval
+        self.resume_ratio = resume_ratio
+        self.min_concurrent_items = min_concurrent_items
+        self.min_release = min_release
+        self.throttled = False
+        self._released_until = 0.0
+        self._concurrent_items = None
+        self._task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create extension instance from crawler."""
+        settings = crawler.settings
+        budget_mb = settings.getint('MEMORY_BUDGET_MB', 0)
+        if not budget_mb:
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            budget=budget_mb * 1024 * 1024,
+            interval=settings.getfloat('MEMORY_BUDGET_CHECK_INTERVAL', 5.0),
+            resume_ratio=settings.getfloat('MEMORY_BUDGET_RESUME_RATIO', 0.85),
+            min_concurrent_items=settings.getint('MEMORY_BUDGET_MIN_CONCURRENT_ITEMS', 10),
+            min_release=settings.getfloat('MEMORY_BUDGET_MIN_RELEASE', 10.0),
+        )
+        crawler.signals.connect(ext.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(ext.engine_stopped, signal=signals.engine_stopped)
+        return ext
+
+    def engine_started(self):
+        """Start the periodic RSS check."""
+        self.crawler.stats.set_value('memory_budget/limit', self.budget)
+        self._task = task.LoopingCall(self.check)
+        self._task.start(self.interval, now=True)
+
+    def engine_stopped(self):
+        """Stop checking and report the peak RSS."""
+        if self._task is not None and self._task.running:
+            self._task.stop()
+        peak = self.crawler.stats.get_value('memory_budget/peak_rss', 0)
+        logger.info(
+            f"Peak RSS: {peak / 1024 / 1024:.1f} MiB "
+            f"(budget {self.budget / 1024 / 1024:.0f} MiB)"
+        )
+
+    def check(self):
+        """Compare RSS against the budget and apply or release backpressure."""
+        rss = get_rss()
+        self.crawler.stats.max_value('memory_budget/peak_rss', rss)
+
+        if not self.throttled and rss > self.budget and time.monotonic() >= self._released_until:
+            self._apply_backpressure(rss)
+        elif self.throttled and rss < self.budget * self.resume_ratio:
+            self._release_backpressure(rss)
+        elif self.throttled and self._is_drained():
+            # Freed memory is not always returned to the OS, so waiting for
+            # RSS alone could stall the crawl once nothing is left in flight.
+            # RSS is still over budget, so new requests keep going to disk.
+            self._released_until = time.monotonic() + self.min_release
+            self._release_backpressure(rss, spill=True)
+        elif not self.throttled and rss < self.budget * self.resume_ratio:
+            self._set_spilling(False)
+
+    def _apply_backpressure(self, rss):
+        engine = self.crawler.engine
+        self.throttled = True
+        self.crawler.stats.inc_value('memory_budget/throttled')
+        logger.warning(
+            f"RSS {rss / 1024 / 1024:.1f} MiB is over the memory budget, "
+            f"pausing new downloads"
+        )
+
+        engine.pause()
+        self._concurrent_items = engine.scraper.concurrent_items
+        engine.scraper.concurrent_items = min(
+            self._concurrent_items, self.min_concurrent_items
+        )
+        scheduler = engine.slot.scheduler if engine.slot else None
+        if hasattr(scheduler, 'spill'):
+            scheduler.spill()
+
+    def _release_backpressure(self, rss, spill=False):
+        engine = self.crawler.engine
+        self.throttled = False
+        logger.info(f"RSS {rss / 1024 / 1024:.1f} MiB, resuming downloads")
+
+        engine.scraper.concurrent_items = self._concurrent_items
+        self._set_spilling(spill)
+        engine.unpause()
+        # unpause() only clears a flag; don't wait for the engine's heartbeat
+        if engine.slot is not None:
+            engine.slot.nextcall.schedule()
+
+    def _set_spilling(self, spilling):
+        engine = self.crawler.engine
+        scheduler = engine.slot.scheduler if engine.slot else None
+        if hasattr(scheduler, 'spill'):
+            scheduler.spilling = spilling
+
+    def _is_drained(self):
+        """Return True if no downloads or items are being processed."""
+        engine = self.crawler.engine
+        slot = engine.scraper.slot
+        return not engine.downloader.active and (slot is None or slot.is_idle())
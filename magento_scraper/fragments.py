@@ -0,0 +1,72 @@
+import re
+from scrapy.selector import Selector
+
+# Regions of a Magento product page that parse_product reads
+TITLE_RE = re.compile(rb'<span\b[^>]*data-ui-id="page-title-wrapper"[^>]*>.*?</span>', re.S)
+SKU_RE = re.compile(rb'<div\b[^>]*itemprop="sku"[^>]*>.*?</div>', re.S)
+DESCRIPTION_RE = re.compile(
+    rb'<div\b[^>]*class="(?=[^"]*\bproduct\b)(?=[^"]*\battribute\b)'
+    rb'(?=[^"]*\bdescription\b)[^"]*"[^>]*>'
+)
+INIT_SCRIPT_RE = re.compile(
+    rb'<script\b[^>]*type="text/x-magento-init"[^>]*>.*?</script>', re.S
+)
+PRICE_RE = re.compile(rb'<span\b[^>]*data-price-type="(finalPrice|oldPrice)"[^>]*>')
+STOCK_RE = re.compile(rb'<div\b[^>]*class="stock\b[^"]*"[^>]*>.*?</div>', re.S)
+DIV_TAG_RE = re.compile(rb'<(/?)div\b', re.I)
+# Markup the colour/size fallback selectors need: server-rendered swatches
+# or a <select> for the attribute. Without it they can't match.
+OPTIONS_MARKUP_RE = re.compile(rb'swatch-attribute|swatch-option\b|<select\b[^>]*(?:color|size)', re.I)
+
+
+def _balanced_div(body, match):
+    """Return the full ``<div>`` element whose start tag is ``match``."""
+    depth = 1
+    for tag in DIV_TAG_RE.finditer(body, match.end()):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            end = body.find(b'>', tag.end())
+            if end == -1:
+                return None
+            return body[match.start():end + 1]
+    return None
+
+
+def extract_product_fragments(response):
+    """
+    Build a selector over only the regions of a product page that
+    ``parse_product`` needs, scanning the raw bytes instead of parsing the
+    whole document. Returns None when a required region can't be found, in
+    which case the caller should use the full response.
+    """
+    body = response.body
+
+    title = TITLE_RE.search(body)
+    sku = SKU_RE.search(body)
+    if not title or not sku:
+        return None
+
+    fragments = [title.group(0), sku.group(0)]
+
+    description = DESCRIPTION_RE.search(body)
+    if description:
+        element = _balanced_div(body, description)
+        if element is None:
+            return None
+        fragments.append(element)
+
+    # Only the attributes of the first price box of each type are needed
+    price_types = set()
+    for price in PRICE_RE.finditer(body):
+        if price.group(1) not in price_types:
+            price_types.add(price.group(1))
+            fragments.append(price.group(0) + b'</span>')
+
+    stock = STOCK_RE.search(body)
+    if stock:
+        fragments.append(stock.group(0))
+
+    fragments.extend(m.group(0) for m in INIT_SCRIPT_RE.finditer(body))
+
+    html = b'<html><body>' + b''.join(fragments) + b'</body></html>'
+    return Selector(text=html.decode(response.encoding, errors='replace'))
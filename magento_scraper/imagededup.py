@@ -0,0 +1,121 @@
+import re
+import json
+import logging
+from io import BytesIO
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Magento 2: /media/catalog/product/cache/<hash>/w/b/file.jpg
+# Magento 1: /media/catalog/product/cache/<store>/<type>/<WxH>/<hash>/w/b/file.jpg
+IMAGE_CACHE_RE = re.compile(r'/cache/(?:\d+/[a-z_]+/(?:\d*x\d*/)?)?[0-9a-f]{32}/')
+
+
+def normalize_image_url(url):
+    """Strip Magento's image-cache path segments so every resized copy maps to one URL."""
+    return IMAGE_CACHE_RE.sub('/', url, count=1)
+
+
+def perceptual_hash(image_bytes, size=8):
+    """
+    Return ``(colour, dhash)`` for an image. ``dhash`` is the 64-bit
+    difference hash: each bit tells whether a pixel of a downscaled
+    grayscale copy is brighter than its right neighbour. The difference
+    hash ignores colour, so ``colour`` (the mean RGB, 3 bits per channel)
+    keeps colour variants of the same product shot apart.
+
+    Runs in a worker thread, so PIL is imported here.
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(image_bytes)) as image:
+        rgb = image.convert('RGB')
+        red, green, blue = rgb.resize((1, 1), Image.BOX).getpixel((0, 0))
+        pixels = list(
+            rgb.convert('L').resize((size + 1, size), Image.LANCZOS).getdata()
+        )
+
+    colour = (red >> 5) << 6 | (green >> 5) << 3 | (blue >> 5)
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            offset = row * (size + 1) + col
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return colour, value
+
+
+class ImageHashIndex:
+    """
+    Index of perceptual hashes of stored images. Near-duplicate lookups
+    split each 64-bit hash into ``max_distance + 1`` bands; two hashes within
+    ``max_distance`` bits of each other must share at least one band exactly,
+    so only images of the same colour in matching band buckets are compared.
+
+    ``urls`` maps the URLs of near-duplicates to the image stored for them,
+    so they are not downloaded again on the next run.
+    """
+
+    BITS = 64
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_width = self.BITS // self.bands
+        self.entries = {}  # (colour, hash) -> stored image info
+        self.buckets = [{} for _ in range(self.bands)]
+        self.urls = {}  # URL of a near-duplicate -> stored image info
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_width) - 1
+        return [(value >> (i * self.band_width)) & mask for i in range(self.bands)]
+
+    def find(self, image_hash):
+        """Return the stored info of a near-identical image, or None."""
+        if image_hash in self.entries:
+            return self.entries[image_hash]
+        colour, value = image_hash
+        for bucket, key in zip(self.buckets, self._band_keys(value)):
+            for candidate in bucket.get((colour, key), ()):
+                if bin(candidate ^ value).count('1') <= self.max_distance:
+                    return self.entries[(colour, candidate)]
+        return None
+
+    def add(self, image_hash, info):
+        """Record a stored image under its ``(colour, dhash)`` hash."""
+        if image_hash in self.entries:
+            return
+        self.entries[image_hash] = info
+        colour, value = image_hash
+        for bucket, key in zip(self.buckets, self._band_keys(value)):
+            bucket.setdefault((colour, key), []).append(value)
+
+    def add_url(self, url, info):
+        """Record that ``url`` is a near-duplicate of the stored image ``info``."""
+        self.urls[url] = info
+
+    def load(self, path):
+        """Load entries saved by ``save``; a missing file is an empty index."""
+        path = Path(path)
+        if not path.exists():
+            return
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if 'url' in entry:
+                    self.add_url(entry.pop('url'), entry)
+                else:
+                    self.add((entry.pop('colour'), int(entry.pop('hash'), 16)), entry)
+        logger.info(f"Loaded {len(self)} image hashes and {len(self.urls)} duplicate URLs from {path}")
+
+    def save(self, path):
+        """Write the index and the duplicate URLs as JSON lines."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for (colour, value), info in self.entries.items():
+                f.write(json.dumps({'colour': colour, 'hash': f'{value:016x}', **info}) + '\n')
+            for url, info in self.urls.items():
+                f.write(json.dumps({'url': url, **info}) + '\n')
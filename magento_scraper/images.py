@@ -0,0 +1,147 @@
+import logging
+import hashlib
+from itemadapter import ItemAdapter
+from scrapy.http import Request
+from scrapy.pipelines.images import ImagesPipeline
+from scrapy.settings import Settings
+from twisted.internet import reactor, threads
+from twisted.python.threadpool import ThreadPool
+from .imagededup import ImageHashIndex, normalize_image_url, perceptual_hash
+
+logger = logging.getLogger(__name__)
+
+
+class CustomImagesPipeline(ImagesPipeline):
+    """
+    Custom image pipeline that extends the default ImagesPipeline
+    to handle image downloading and processing.
+
+    Magento serves one picture under many cache-busting URLs, and
+    configurable products share gallery images across child SKUs. URLs are
+    normalized before download so each picture is fetched once, and
+    downloaded images are indexed by perceptual hash so near-identical
+    copies are stored once and referenced by every item that uses them.
+    The URLs of such copies are kept with the index and point at the stored
+    image from then on, so they are not downloaded again.
+    """
+    
+    def __init__(self, store_uri, download_func=None, settings=None):
+        super().__init__(store_uri, download_func=download_func, settings=settings)
+        if isinstance(settings, dict) or settings is None:
+            settings = Settings(settings)
+        self.normalize_urls = settings.getbool('IMAGES_NORMALIZE_URLS', True)
+        self.hash_index_path = settings.get('IMAGES_HASH_INDEX')
+        self.hash_workers = settings.getint('IMAGES_HASH_WORKERS', 4)
+        self.hash_index = ImageHashIndex(settings.getint('IMAGES_HASH_DISTANCE', 3))
+        self.hash_pool = None
+    
+    def open_spider(self, spider):
+        """Load the hash index and start the hashing worker pool."""
+        super().open_spider(spider)
+        if self.hash_index_path:
+            self.hash_index.load(self.hash_index_path)
+        self.hash_pool = ThreadPool(minthreads=1, maxthreads=self.hash_workers, name='image-hash')
+        self.hash_pool.start()
+    
+    def close_spider(self, spider):
+        """Persist the hash index and stop the worker pool."""
+        if self.hash_pool is not None:
+            self.hash_pool.stop()
+            self.hash_pool = None
+        if self.hash_index_path:
+            self.hash_index.save(self.hash_index_path)
+    
+    def get_media_requests(self, item, info):
+        """Generate a media request object for each distinct image."""
+        urls = ItemAdapter(item).get(self.images_urls_field) or []
+        if not isinstance(urls, list):
+            return []
+        
+        requests = {}
+        for url in urls:
+            if not url or not isinstance(url, str):
+                continue
+            if self.normalize_urls:
+                url = normalize_image_url(url)
+            # A known near-duplicate is up to date if the image it matched is
+            duplicate = self.hash_index.urls.get(url)
+            requests.setdefault(url, Request(
+                url=url,
+                meta={
+                    'image_url': url,
+                    'filename': duplicate['path'] if duplicate else self._get_image_filename(url),
+                    # Own connection pool and download slot, see magento_scraper.downloader
+                    'download_class': 'media',
+                }
+            ))
+        return list(requests.values())
+    
+    def file_path(self, request, response=None, info=None, *, item=None):
+        """Return the filename for the downloaded image."""
+        return request.meta.get('filename', '')
+    
+    def media_downloaded(self, response, request, info, *, item=None):
+        """Hash the image in a worker thread and store it unless a near-duplicate is stored already."""
+        if response.status != 200 or not response.body:
+            # Let the parent class report the failure
+            return super().media_downloaded(response, request, info, item=item)
+        
+        dfd = threads.deferToThreadPool(reactor, self.hash_pool, perceptual_hash, response.body)
+        dfd.addCallback(self._store_unless_duplicate, response, request, info, item)
+        return dfd
+    
+    def _store_unless_duplicate(self, image_hash, response, request, info, item):
+        duplicate = self.hash_index.find(image_hash)
+        if duplicate is not None:
+            self.inc_stats(info.spider, 'duplicate')
+            self.hash_index.add_url(request.url, duplicate)
+            return {
+                'url': request.url,
+                'path': duplicate['path'],
+                'checksum': duplicate['checksum'],
+                'status': 'duplicate',
+            }
+        
+        if self.hash_index.urls.pop(request.url, None) is not None:
+            # No longer a near-duplicate: store it under its own name, not over the image it matched
+            request.meta['filename'] = self._get_image_filename(request.url)
+        result = super().media_downloaded(response, request, info, item=item)
+        self.hash_index.add(image_hash, {'path': result['path'], 'checksum': result['checksum']})
+        return result
+    
+    def item_completed(self, results, item, info):
+        """Called when all image downloads for an item are completed."""
+        adapter = ItemAdapter(item)
+        if self.images_result_field not in adapter.field_names():
+            return item
+        
+        images = []
+        for ok, image_info in results:
+            if ok:
+                images.append({
+                    'url': image_info.get('url', ''),
+                    'path': image_info.get('path', ''),
+                    'checksum': image_info.get('checksum', ''),
+                    'status': image_info.get('status', 'downloaded')
+                })
+            else:
+                images.append({
+                    'status': 'failed',
+                    'error': str(image_info.value) or 'Unknown error'
+                })
+        
+        # The results replace the URL list the images were downloaded from
+        adapter[self.images_result_field] = images
+        return item
+    
+    def _get_image_filename(self, url):
+        """Generate a filename for the downloaded image."""
+        # Name by URL hash only, so an image shared by several SKUs is stored once
+        url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
+        extension = url.split('?')[0].split('.')[-1].lower()
+        
+        # Ensure the extension is valid
+        if len(extension) > 5 or '/' in extension:
+            extension = 'jpg'
+            
+        return f"full/{url_hash[:2]}/{url_hash}.{extension}"
@@ -47,6 +47,10 @@ class CategoryItem(scrapy.Item):
         input_processor=MapCompose(str.strip),
         output_processor=TakeFirst()
     )
+    # Canonical URL path, the key of the category tree (see magento_scraper.categories)
+    path = scrapy.Field(
+        output_processor=TakeFirst()
+    )
     parent_category = scrapy.Field(
         input_processor=MapCompose(
             remove_tags,
@@ -56,6 +60,11 @@ class CategoryItem(scrapy.Item):
         output_processor=TakeFirst(),
         default=''
     )
+    # Names repeat under different parents, the parent URL does not
+    parent_url = scrapy.Field(
+        output_processor=TakeFirst(),
+        default=''
+    )
     level = scrapy.Field(
         output_processor=TakeFirst(),
         default=0
@@ -64,6 +73,10 @@ class CategoryItem(scrapy.Item):
         input_processor=Identity(),
         default=[]
     )
+    # Store the category belongs to (see magento_scraper.stores)
+    store = scrapy.Field(
+        output_processor=TakeFirst()
+    )
     # Timestamp when the item was scraped (ISO 8601 format)
     timestamp = scrapy.Field(
         output_processor=TakeFirst(),
@@ -92,6 +105,11 @@ class ProductItem(scrapy.Item):
         required=True
     )
     
+    # Store the product was scraped from (see magento_scraper.stores)
+    store = scrapy.Field(
+        output_processor=TakeFirst()
+    )
+    
     # Category information
     category = scrapy.Field(
         input_processor=MapCompose(clean_text),
@@ -105,6 +123,10 @@ class ProductItem(scrapy.Item):
         input_processor=MapCompose(clean_text),
         output_processor=TakeFirst()
     )
+    # Listing page the product was found on
+    category_url = scrapy.Field(
+        output_processor=TakeFirst()
+    )
     # Pricing information
     price = scrapy.Field(
         input_processor=MapCompose(remove_tags, clean_text, extract_price),
@@ -0,0 +1,585 @@
+"""
+Local stand-in for a Magento 2 storefront, for load and regression testing
+without touching a real store:
+
+    python -m magento_scraper.mockstore --products 100000 --port 8765
+
+Pages are generated on request from a seeded catalog, so any catalog size
+costs the same memory and two servers with the same seed serve the same
+store. The markup follows the Luma theme closely enough for
+``MagentoSpider``: navigation menu, paginated listings, product pages with
+price boxes and ``x-magento-init`` swatch/gallery JSON, a sitemap and
+product images. Latency, server errors and bursts of 429s can be injected.
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from functools import lru_cache
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# (URL segment, name, [(URL segment, name), ...]) like the Luma demo store
+CATEGORIES = [
+    ('women', 'Women', [('tops-women', 'Tops'), ('bottoms-women', 'Bottoms')]),
+    ('men', 'Men', [('tops-men', 'Tops'), ('bottoms-men', 'Bottoms')]),
+    ('gear', 'Gear', [('bags', 'Bags'), ('fitness-equipment', 'Fitness Equipment'), ('watches', 'Watches')]),
+    ('training', 'Training', [('training-video', 'Video Download')]),
+]
+# Top-level categories whose products come in colours and sizes
+APPAREL = {'women', 'men'}
+
+COLORS = ['Black', 'Blue', 'Gray', 'Green', 'Orange', 'Purple', 'Red', 'White', 'Yellow']
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+ADJECTIVES = ['Breathe-Easy', 'Radiant', 'Stellar', 'Gravity', 'Aero', 'Summit', 'Nimbus', 'Zing', 'Taurus', 'Echo']
+NOUNS = ['Tee', 'Tank', 'Jacket', 'Hoodie', 'Short', 'Pant', 'Bag', 'Bottle', 'Watch', 'Mat']
+WORDS = ('comfort stretch fabric workout lightweight breathable durable moisture wicking '
+         'everyday training outdoor support pocket seam fit classic').split()
+
+SITEMAP_CHUNK = 10000
+
+# 1x1 GIF served when Pillow is not installed
+BLANK_GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\xff\xff\xff\x00\x00\x00!\xf9\x04'
+             b'\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+
+class MockCatalog:
+    """
+    Deterministic synthetic catalog. Product ``i`` belongs to leaf category
+    ``i % len(leaves)``; top-level categories list the products of all their
+    subcategories, as Magento anchor categories do. ``revision`` changes the
+    price and stock of ``change_rate`` of the products, to exercise change
+    detection across runs.
+    """
+
+    def __init__(self, products=1000, per_page=12, seed=0, revision=0, change_rate=0.05):
+        self.size = products
+        self.per_page = per_page
+        self.seed = seed
+        self.revision = revision
+        self.change_rate = change_rate
+        self.leaves = []  # (path, name, top-level segment)
+        self.categories = {}  # path -> (name, [leaf indexes])
+        for segment, name, children in CATEGORIES:
+            first = len(self.leaves)
+            for child, child_name in children:
+                self.leaves.append((f'{segment}/{child}', child_name, segment))
+            indexes = list(range(first, len(self.leaves)))
+            self.categories[segment] = (name, indexes)
+            for index in indexes:
+                self.categories[self.leaves[index][0]] = (self.leaves[index][1], [index])
+
+    def listing(self, path, page):
+        """Return the product ids on a page of a category and the page count."""
+        _, leaves = self.categories[path]
+        width = len(self.leaves)
+        # Products of the category in id order: k -> k // n * width + leaves[k % n]
+        total = sum(max(0, (self.size - leaf + width - 1) // width) for leaf in leaves)
+        pages = max(1, -(-total // self.per_page))
+        start = (page - 1) * self.per_page
+        ids = []
+        for k in range(start, min(start + self.per_page, total)):
+            ids.append(k // len(leaves) * width + leaves[k % len(leaves)])
+        return ids, pages
+
+    def product(self, product_id):
+        """Return the attributes of a product, or None if it does not exist."""
+        if not 0 <= product_id < self.size:
+            return None
+        rng = random.Random(self.seed * 1000003 + product_id)
+        leaf_path, leaf_name, segment = self.leaves[product_id % len(self.leaves)]
+        price = rng.randrange(1500, 12000) / 100
+        in_stock = rng.random() < 0.9
+        changed = random.Random(f'{self.seed}:{product_id}:{self.revision}').random() < self.change_rate
+        if self.revision and changed:
+            price = round(price * 1.1, 2)
+            in_stock = not in_stock
+
+        product = {
+            'id': product_id,
+            'slug': f'mock-product-{product_id}',
+            'sku': f'MK{product_id:07d}',
+            'name': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {product_id}',
+            'category': leaf_path,
+            'price': price,
+            'old_price': round(price * 1.25, 2) if rng.random() < 0.2 else None,
+            'in_stock': in_stock,
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(20, 60))).capitalize() + '.',
+            'colors': sorted(rng.sample(COLORS, rng.randrange(1, 4))) if segment in APPAREL else [],
+            'sizes': SIZES[rng.randrange(0, 2):rng.randrange(3, 6)] if segment in APPAREL else [],
+        }
+        product['images'] = [
+            f"/media/catalog/product/{product['slug'][-2]}/{product['slug'][-1]}/{product['sku'].lower()}-{n}.jpg"
+            for n in range(rng.randrange(1, 4))
+        ]
+        return product
+
+
+def _page(title, body):
+    return (
+        f'<!doctype html><html><head><title>{escape(title)}</title></head><body>'
+        f'{body}</body></html>'
+    )
+
+
+def render_menu():
+    items = []
+    for segment, name, children in CATEGORIES:
+        links = ''.join(
+            f'<li class="level1"><a href="/{segment}/{child}.html">{escape(child_name)}</a></li>'
+            for child, child_name in children
+        )
+        items.append(
+            f'<li class="level0"><a href="/{segment}.html"><span class="ui-menu-icon"></span>'
+            f'<span>{escape(name)}</span></a><ul class="level1 submenu">{links}</ul></li>'
+        )
+    return f'<nav class="navigation"><ul class="level0">{"".join(items)}</ul></nav>'
+
+
+def render_home(catalog):
+    return _page('Home Page', render_menu() + '<div class="columns">Welcome</div>')
+
+
+def render_listing(catalog, path, page):
+    ids, pages = catalog.listing(path, page)
+    name, _ = catalog.categories[path]
+    items = []
+    for product_id in ids:
+        product = catalog.product(product_id)
+        items.append(
+            f'<li class="item product product-item"><div class="product-item-info">'
+            f'<a href="/{product["slug"]}.html" class="product photo product-item-photo">'
+            f'<span class="product-image-wrapper"><img src="{product["images"][0]}" alt="{escape(product["name"])}"/></span></a>'
+            f'<span class="price">${product["price"]:.2f}</span></div></li>'
+        )
+    pager = ''
+    if page < pages:
+        pager = f'<a class="action next" href="/{path}.html?p={page + 1}"><span>Next</span></a>'
+    return _page(name, (
+        f'{render_menu()}<h1 class="page-title"><span>{escape(name)}</span></h1>'
+        f'<ol class="products list items product-items">{"".join(items)}</ol>'
+        f'<div class="pages">{pager}</div>'
+    ))
+
+
+def render_product(catalog, product, base_url):
+    images = [base_url + path for path in product['images']]
+    price_boxes = (
+        f'<span id="product-price-{product["id"]}" data-price-amount="{product["price"]}" '
+        f'data-price-type="finalPrice" class="price-wrapper "><span class="price">${product["price"]:.2f}</span></span>'
+    )
+    if product['old_price']:
+        price_boxes += (
+            f'<span id="old-price-{product["id"]}" data-price-amount="{product["old_price"]}" '
+            f'data-price-type="oldPrice" class="price-wrapper "><span class="price">${product["old_price"]:.2f}</span></span>'
+        )
+    stock = 'available' if product['in_stock'] else 'unavailable'
+
+    scripts = [{
+        '[data-gallery-role=gallery-placeholder]': {
+            'mage/gallery/gallery': {
+                'data': [{'full': url, 'img': url, 'isMain': n == 0} for n, url in enumerate(images)],
+            },
+        },
+    }]
+    if product['colors']:
+        attributes = {
+            '93': {'code': 'color', 'label': 'Color',
+                   'options': [{'id': str(50 + n), 'label': color} for n, color in enumerate(product['colors'])]},
+            '144': {'code': 'size', 'label': 'Size',
+                    'options': [{'id': str(160 + n), 'label': size} for n, size in enumerate(product['sizes'])]},
+        }
+        index, option_prices, child_images = {}, {}, {}
+        child = product['id'] * 100
+        for c, _ in enumerate(product['colors']):
+            for s, _ in enumerate(product['sizes']):
+                child += 1
+                index[str(child)] = {'93': str(50 + c), '144': str(160 + s)}
+                option_prices[str(child)] = {'finalPrice': {'amount': product['price']}}
+                child_images[str(child)] = [{'full': images[c % len(images)]}]
+        config = {
+            'attributes': attributes,
+            'index': index,
+            'optionPrices': option_prices,
+            'images': child_images,
+            'prices': {'finalPrice': {'amount': product['price']}},
+        }
+        scripts.append({
+            '[data-role=swatch-options]': {'Magento_Swatches/js/swatch-renderer': {'jsonConfig': config}},
+        })
+
+    body = (
+        f'{render_menu()}'
+        f'<h1 class="page-title"><span class="base" data-ui-id="page-title-wrapper" itemprop="name">'
+        f'{escape(product["name"])}</span></h1>'
+        f'<div class="product-info-price"><div class="price-box price-final_price">{price_boxes}</div></div>'
+        f'<div class="product-info-stock-sku">'
+        f'<div class="stock {stock}" title="Availability"><span>{"In stock" if product["in_stock"] else "Out of stock"}</span></div>'
+        f'<div class="product attribute sku"><strong class="type">SKU</strong>'
+        f'<div class="value" itemprop="sku">{product["sku"]}</div></div></div>'
+        f'<div class="gallery-placeholder" data-gallery-role="gallery-placeholder">'
+        f'<img src="{images[0]}" alt="main product photo"/></div>'
+        f'<div class="swatch-opt" data-role="swatch-options"></div>'
+        f'<div class="product data items"><div class="product attribute description">'
+        f'<div class="value"><p>{escape(product["description"])}</p></div></div></div>'
+        + ''.join(f'<script type="text/x-magento-init">{json.dumps(data)}</script>' for data in scripts)
+    )
+    return _page(product['name'], body)
+
+
+def render_sitemap_index(catalog, base_url):
+    chunks = -(-catalog.size // SITEMAP_CHUNK)
+    entries = [f'<sitemap><loc>{base_url}/sitemap-categories.xml</loc></sitemap>']
+    entries += [f'<sitemap><loc>{base_url}/sitemap-{n}.xml</loc></sitemap>' for n in range(chunks)]
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + ''.join(entries) + '</sitemapindex>')
+
+
+def render_sitemap(urls):
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            + ''.join(f'<url><loc>{url}</loc></url>' for url in urls) + '</urlset>')
+
+
+@lru_cache(maxsize=1024)
+def render_image(path):
+    """Return a small JPEG with a pattern derived from ``path``."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return BLANK_GIF, 'image/gif'
+    from io import BytesIO
+
+    digest = hashlib.md5(path.encode()).digest()
+    image = Image.new('RGB', (8, 8))
+    image.putdata([(digest[i % 16], digest[(i * 7) % 16], digest[(i * 13) % 16]) for i in range(64)])
+    buffer = BytesIO()
+    image.resize((160, 160), Image.NEAREST).save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue(), 'image/jpeg'
+
+
+class MockStoreHandler(BaseHTTPRequestHandler):
+    """Serves the pages of ``self.server.store``."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MockMagento/1.0'
+
+    def do_GET(self):
+        delay, (status, headers, body, content_type) = self.server.store.respond(self.path)
+        if delay:
+            time.sleep(delay)
+        self.server.store.count(status)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MockStore:
+    """
+    A mock storefront served from a background thread:
+
+        with MockStore(MockCatalog(products=500), error_rate=0.01) as store:
+            process.crawl(MagentoSpider, stores=[store.store_config()])
+
+    ``latency`` (plus up to ``jitter``) seconds are added to every response,
+    ``error_rate`` of the requests get a 500, and when ``burst_every`` is set
+    every ``burst_every``-th request starts ``burst_length`` 429 responses.
+    """
+
+    def __init__(self, catalog=None, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, burst_every=0, burst_length=0, retry_after=1, seed=0):
+        self.catalog = catalog or MockCatalog(seed=seed)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.responses = Counter()
+        self._requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.scheme = 'http'
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'{self.scheme}://{self.host}:{self.port}'
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), MockStoreHandler)
+        self._server.daemon_threads = True
+        self._server.store = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mockstore', daemon=True)
+        self._thread.start()
+        logger.info(f"Mock store serving {self.catalog.size} products at {self.url}/")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def store_config(self, name='mock'):
+        """Return a StoreConfig that points the spider at this server."""
+        from .stores import StoreConfig
+        return StoreConfig(
+            name=name,
+            start_urls=[f'{self.url}/'],
+            categories={segment: title for segment, title, _ in CATEGORIES},
+        )
+
+    def count(self, status):
+        with self._lock:
+            self.responses[status] += 1
+
+    def fault(self, path):
+        """
+        Return ``(delay, failure)`` for a request: the latency to add, and
+        ``(status, headers)`` for an injected failure or None.
+        """
+        with self._lock:
+            self._requests += 1
+            number = self._requests
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0)
+            error = self.error_rate and self._random.random() < self.error_rate
+        if path == '/robots.txt':
+            return delay, None
+        if self.burst_every and number % self.burst_every < self.burst_length:
+            return delay, (429, [('Retry-After', str(self.retry_after))])
+        if error:
+            return delay, (500, [])
+        return delay, None
+
+    def respond(self, path):
+        """Return ``(status, headers, body, content_type)`` for a request path."""
+        delay, failure = self.fault(path)
+        if failure:
+            status, headers = failure
+            return delay, (status, headers, b'', 'text/plain')
+        try:
+            status, body, content_type = self.route(path)
+        except Exception:
+            logger.exception(f"Mock store failed to render {path}")
+            status, body, content_type = 500, b'', 'text/plain'
+        return delay, (status, [], body, content_type)
+
+    def route(self, path):
+        """Return ``(status, body, content_type)`` for a request path."""
+        parts = urlsplit(path)
+        path = parts.path
+        catalog = self.catalog
+
+        if path in ('/', '/index.html'):
+            return 200, render_home(catalog).encode(), 'text/html; charset=utf-8'
+        if path == '/robots.txt':
+            return 200, f'User-agent: *\nDisallow: /checkout/\nSitemap: {self.url}/sitemap.xml\n'.encode(), 'text/plain'
+        if path == '/sitemap.xml':
+            return 200, render_sitemap_index(catalog, self.url).encode(), 'application/xml'
+        if path == '/sitemap-categories.xml':
+            urls = [f'{self.url}/{category}.html' for category in catalog.categories]
+            return 200, render_sitemap(urls).encode(), 'application/xml'
+        if path.startswith('/sitemap-') and path.endswith('.xml'):
+            chunk = path[len('/sitemap-'):-len('.xml')]
+            if chunk.isdigit():
+                start = int(chunk) * SITEMAP_CHUNK
+                ids = range(start, min(start + SITEMAP_CHUNK, catalog.size))
+                urls = [f'{self.url}/mock-product-{i}.html' for i in ids]
+                if urls:
+                    return 200, render_sitemap(urls).encode(), 'application/xml'
+        if path.startswith('/media/catalog/product/'):
+            body, content_type = render_image(path)
+            return 200, body, content_type
+        if path.endswith('.html'):
+            slug = path[1:-len('.html')]
+            if slug in catalog.categories:
+                try:
+                    page = int(parse_qs(parts.query).get('p', ['1'])[0])
+                except ValueError:
+                    page = 1
+                return 200, render_listing(catalog, slug, max(page, 1)).encode(), 'text/html; charset=utf-8'
+            if slug.startswith('mock-product-') and slug[len('mock-product-'):].isdigit():
+                product = catalog.product(int(slug[len('mock-product-'):]))
+                if product:
+                    return 200, render_product(catalog, product, self.url).encode(), 'text/html; charset=utf-8'
+        return 404, _page('404 Not Found', '<h1>Whoops, our bad...</h1>').encode(), 'text/html; charset=utf-8'
+
+
+def self_signed_certificate(host):
+    """Return a throwaway pyOpenSSL key and self-signed certificate for ``host``."""
+    from datetime import datetime, timedelta
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+    from OpenSSL import crypto
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=7))
+        .sign(key, hashes.SHA256())
+    )
+    return crypto.PKey.from_cryptography_key(key), crypto.X509.from_cryptography(certificate)
+
+
+def serve_tls(store, http2=True):
+    """
+    Serve ``store`` over TLS with Twisted (which speaks HTTP/2 when the
+    client negotiates it) until the process is stopped. Needs pyOpenSSL,
+    and ``Twisted[http2]`` for HTTP/2. With ``http2=False`` only HTTP/1.1
+    is offered, to test clients falling back.
+    """
+    from OpenSSL import SSL
+    from zope.interface import implementer_only
+    from twisted.internet import reactor
+    from twisted.internet.interfaces import IProtocolFactory
+    from twisted.web.resource import Resource
+    from twisted.web.server import Site, NOT_DONE_YET
+
+    class MockStoreResource(Resource):
+        isLeaf = True
+
+        def render_GET(self, request):
+            delay, (status, headers, body, content_type) = store.respond(request.uri.decode('latin-1'))
+            finished = request.notifyFinish()
+            finished.addErrback(lambda _: None)
+
+            def send():
+                if request.finished or request._disconnected:
+                    return
+                store.count(status)
+                request.setResponseCode(status)
+                request.setHeader('Content-Type', content_type)
+                for name, value in headers:
+                    request.setHeader(name, value)
+                request.write(body)
+                request.finish()
+
+            reactor.callLater(delay, send)
+            return NOT_DONE_YET
+
+    # Twisted sets ALPN on a context after using it, which recent pyOpenSSL
+    # refuses, so the site doesn't advertise protocols and the context sets them
+    @implementer_only(IProtocolFactory)
+    class MockStoreSite(Site):
+        noisy = False
+
+    site = MockStoreSite(MockStoreResource())
+    protocols = [b'h2', b'http/1.1'] if http2 else [b'http/1.1']
+    key, certificate = self_signed_certificate(store.host)
+
+    def select_protocol(connection, offered):
+        # Like most servers, carry on without ALPN when nothing matches
+        return next((p for p in protocols if p in offered), SSL.NO_OVERLAPPING_PROTOCOLS)
+
+    class ContextFactory:
+        def getContext(self):
+            context = SSL.Context(SSL.TLS_METHOD)
+            context.use_privatekey(key)
+            context.use_certificate(certificate)
+            context.set_alpn_select_callback(select_protocol)
+            return context
+
+    port = reactor.listenSSL(store.port, site, ContextFactory(), interface=store.host)
+    store.scheme = 'https'
+    store.port = port.getHost().port
+    logger.info(
+        f"Mock store serving {store.catalog.size} products at {store.url}/ "
+        f"({' and '.join(p.decode() for p in protocols)})"
+    )
+    print(store.url, flush=True)
+    reactor.run()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m magento_scraper.mockstore',
+        description='Serve a synthetic Magento storefront for offline crawls.',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='0 picks a free port')
+    parser.add_argument('--products', type=int, default=1000, help='catalog size')
+    parser.add_argument('--per-page', type=int, default=12, help='products per listing page')
+    parser.add_argument('--seed', type=int, default=0, help='catalog seed')
+    parser.add_argument('--revision', type=int, default=0,
+                        help='catalog revision; each one changes price and stock of some products')
+    parser.add_argument('--change-rate', type=float, default=0.05,
+                        help='share of products changed by a revision')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 500')
+    parser.add_argument('--burst-every', type=int, default=0, help='start a burst of 429s every N requests')
+    parser.add_argument('--burst-length', type=int, default=0, help='number of 429s per burst')
+    parser.add_argument('--tls', action='store_true',
+                        help='serve HTTPS with a self-signed certificate, offering HTTP/2 and HTTP/1.1')
+    parser.add_argument('--no-http2', action='store_true', help='with --tls, offer HTTP/1.1 only')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    catalog = MockCatalog(
+        products=args.products, per_page=args.per_page, seed=args.seed,
+        revision=args.revision, change_rate=args.change_rate,
+    )
+    store = MockStore(
+        catalog, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, burst_every=args.burst_every, burst_length=args.burst_length,
+        seed=args.seed,
+    )
+    if args.tls:
+        serve_tls(store, http2=not args.no_http2)
+        logger.info(f"Responses: {dict(store.responses)}")
+        return 0
+
+    store.start()
+    # Machine-readable first line for scripts that start the server
+    print(store.url, flush=True)
+    try:
+        store._thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.stop()
+        logger.info(f"Responses: {dict(store.responses)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,39 +1,63 @@
 import logging
 import hashlib
+import sqlite3
 from pathlib import Path
 from datetime import datetime
 from itemadapter import ItemAdapter, is_item
-from scrapy.exceptions import DropItem
+from scrapy import signals
+from scrapy.exceptions import DropItem, NotConfigured
 from scrapy.exporters import JsonItemExporter
-from scrapy.pipelines.images import ImagesPipeline
-from scrapy.http import Request
-from PIL import Image
 import json
+from .checkpoint import checkpoint_saving, load_checkpoint
 
 logger = logging.getLogger(__name__)
 
+
+def __getattr__(name):
+    # The image pipeline pulls in Scrapy's media pipelines, and PIL when it
+    # is instantiated; only import it when a crawl actually enables it
+    if name == 'CustomImagesPipeline':
+        from .images import CustomImagesPipeline
+        return CustomImagesPipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 class MagentoScraperPipeline:
     """
     Main pipeline for processing scraped items with comprehensive validation,
     cleaning, and data enrichment.
     """
     
-    def __init__(self, stats):
+    def __init__(self, stats, checkpoint_dir=None):
         self.stats = stats
         self.seen_urls = set()
         self.exporters = {}
         self.files = {}
+        self.checkpoint_dir = checkpoint_dir
+        self.closed_state = None
         
     @classmethod
     def from_crawler(cls, crawler):
         """Create pipeline instance from crawler."""
-        return cls(stats=crawler.stats)
+        pipeline = cls(
+            stats=crawler.stats,
+            checkpoint_dir=crawler.settings.get('CHECKPOINT_DIR')
+        )
+        if pipeline.checkpoint_dir:
+            crawler.signals.connect(pipeline.checkpoint_saving, signal=checkpoint_saving)
+        return pipeline
     
     def open_spider(self, spider):
         """Initialize resources when spider is opened."""
         self.stats.set_value('items_processed', 0)
         self.stats.set_value('items_dropped', 0)
         
+        # Continue the previous export if resuming from a checkpoint
+        checkpoint = load_checkpoint(self.checkpoint_dir)
+        state = checkpoint['components'].get(self.__class__.__name__) if checkpoint else None
+        if state and Path(state['file_path']).exists():
+            self._resume_exporter(spider, state)
+            return
+        
         # Create output directory if it doesn't exist
         output_dir = Path('output')
         output_dir.mkdir(exist_ok=True)
@@ -42,17 +66,53 @@ class MagentoScraperPipeline:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_path = output_dir / f'{spider.name}_{timestamp}.jsonl'
         self.files[spider] = open(file_path, 'wb')
-        self.exporters[spider] = JsonItemExporter(
-            self.files[spider],
+        self.exporters[spider] = self._create_exporter(self.files[spider])
+        self.exporters[spider].start_exporting()
+    
+    def _create_exporter(self, file):
+        """Create the JSON exporter writing to ``file``."""
+        return JsonItemExporter(
+            file,
             encoding='utf-8',
             indent=2,
             ensure_ascii=False
         )
-        self.exporters[spider].start_exporting()
+    
+    def _resume_exporter(self, spider, state):
+        """Reopen the export file at the last checkpointed offset."""
+        # Anything written after the checkpoint belongs to requests that
+        # are still in the frontier and will be exported again
+        self.files[spider] = open(state['file_path'], 'r+b')
+        self.files[spider].seek(state['offset'])
+        self.files[spider].truncate()
+        self.exporters[spider] = self._create_exporter(self.files[spider])
+        self.exporters[spider].first_item = state['first_item']
+        self.seen_urls = set(state['seen_urls'])
+        logger.info(f"Resuming export to {state['file_path']} ({len(self.seen_urls)} items)")
+    
+    def checkpoint_saving(self, spider):
+        """Return the dedup state and exporter offset for a crawl checkpoint."""
+        if spider not in self.files:
+            return None
+        file = self.files[spider]
+        if file.closed:
+            return self.closed_state
+        file.flush()
+        return {
+            self.__class__.__name__: {
+                'file_path': file.name,
+                'offset': file.tell(),
+                'first_item': self.exporters[spider].first_item,
+                'seen_urls': list(self.seen_urls),
+            }
+        }
     
     def close_spider(self, spider):
         """Clean up resources when spider is closed."""
         if spider in self.exporters:
+            if self.checkpoint_dir:
+                # The final checkpoint is written after pipelines are closed
+                self.closed_state = self.checkpoint_saving(spider)
             self.exporters[spider].finish_exporting()
             self.files[spider].close()
             
@@ -112,10 +172,11 @@ class MagentoScraperPipeline:
             raise DropItem(f"Error processing item: {e}")
     
     def _get_item_id(self, adapter):
-        """Generate a unique ID for the item based on its URL and SKU."""
+        """Generate a unique ID for the item based on its store, URL and SKU."""
+        store = adapter.get('store', '')
         url = adapter.get('url', '')
         sku = adapter.get('sku', '')
-        return hashlib.md5(f"{url}:{sku}".encode('utf-8')).hexdigest()
+        return hashlib.md5(f"{store}:{url}:{sku}".encode('utf-8')).hexdigest()
     
     def _clean_data(self, adapter):
         """Clean and validate item data."""
@@ -156,66 +217,232 @@ class MagentoScraperPipeline:
             adapter['spider'] = spider.name
 
 
-class CustomImagesPipeline(ImagesPipeline):
+class ChangeDetectionPipeline:
     """
-    Custom image pipeline that extends the default ImagesPipeline
-    to handle image downloading and processing.
+    Pipeline that keeps a compact per-SKU fingerprint of each product's
+    volatile fields (prices, stock, variants) and stable fields (name,
+    description, options) in an indexed SQLite table. It writes change
+    events to a separate JSON lines sink instead of whole items.
+
+    A product listed in several categories gets the category of whichever
+    listing reached it first, so categories are not fingerprinted.
+
+    Events: new_sku, relisted, price_changed, back_in_stock, out_of_stock,
+    variants_changed, details_changed and, at the end of a completed
+    crawl, delisted for SKUs of crawled stores that were not seen.
+
+    With ``CHECKPOINT_DIR`` set, the table is only committed when a
+    checkpoint is saved, together with the sink offset, so a resumed crawl
+    rolls both back to the same point and emits each event once.
     """
-    
-    def get_media_requests(self, item, info):
-        """Generate a media request object for each image URL."""
-        if 'image_urls' not in item:
-            return []
-            
-        return [
-            Request(
-                url=url,
-                meta={
-                    'item': item,
-                    'image_url': url,
-                    'filename': self._get_image_filename(item, url)
-                }
-            )
-            for url in item.get('image_urls', [])
-            if url and isinstance(url, str)
-        ]
-    
-    def file_path(self, request, response=None, info=None, *, item=None):
-        """Return the filename for the downloaded image."""
-        return request.meta.get('filename', '')
-    
-    def item_completed(self, results, item, info):
-        """Called when all image downloads for an item are completed."""
-        if 'images' not in item:
-            item['images'] = []
-            
-        # Add image paths to the item
-        for ok, image_info in results:
-            if ok:
-                item['images'].append({
-                    'url': image_info.get('url', ''),
-                    'path': image_info.get('path', ''),
-                    'checksum': image_info.get('checksum', ''),
-                    'status': 'downloaded'
-                })
-            else:
-                item['images'].append({
-                    'url': image_info.get('url', ''),
-                    'status': 'failed',
-                    'error': str(image_info.get('exception', 'Unknown error'))
-                })
-                
+
+    VOLATILE_FIELDS = ('price', 'regular_price', 'special_price', 'in_stock', 'variants')
+    STABLE_FIELDS = ('name', 'description', 'colors', 'sizes')
+    # Stored as the database's user_version; stable hashes of another
+    # version were computed over other fields and are not compared
+    STABLE_FIELDS_VERSION = 1
+    COMMIT_EVERY = 100
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sku_state (
+            store TEXT NOT NULL,
+            sku TEXT NOT NULL,
+            url TEXT,
+            volatile_hash BLOB,
+            stable_hash BLOB,
+            price REAL,
+            special_price REAL,
+            in_stock INTEGER,
+            last_seen TEXT,
+            delisted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (store, sku)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS sku_state_last_seen ON sku_state (store, last_seen);
+    """
+
+    def __init__(self, stats, db_path, changes_uri, checkpoint_dir=None):
+        self.stats = stats
+        self.db_path = Path(db_path)
+        self.changes_uri = Path(changes_uri)
+        self.checkpoint_dir = checkpoint_dir
+        self.db = None
+        self.sink = None
+        self.run_id = None
+        self.stores_seen = set()
+        self.pending_writes = 0
+        self.closed_state = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create pipeline instance from crawler."""
+        db_path = crawler.settings.get('CHANGES_DB')
+        if not db_path:
+            raise NotConfigured
+        pipeline = cls(
+            stats=crawler.stats,
+            db_path=db_path,
+            changes_uri=crawler.settings.get('CHANGES_URI', 'output/changes.jsonl'),
+            checkpoint_dir=crawler.settings.get('CHECKPOINT_DIR'),
+        )
+        # Delisting depends on the finish reason, which close_spider doesn't get
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        if pipeline.checkpoint_dir:
+            crawler.signals.connect(pipeline.checkpoint_saving, signal=checkpoint_saving)
+        return pipeline
+
+    def open_spider(self, spider):
+        """Open the fingerprint table and the change event sink."""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.changes_uri.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.db_path))
+        self.db.executescript(self.SCHEMA)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.STABLE_FIELDS_VERSION:
+            self.db.execute('UPDATE sku_state SET stable_hash = NULL')
+            self.db.execute(f'PRAGMA user_version = {self.STABLE_FIELDS_VERSION}')
+            self.db.commit()
+        # Line buffered so subscribers see each event as soon as it happens
+        self.sink = open(self.changes_uri, 'a', encoding='utf-8', buffering=1)
+
+        # A resumed crawl keeps its run id so SKUs seen before the restart
+        # are not reported as delisted
+        checkpoint = load_checkpoint(self.checkpoint_dir)
+        state = checkpoint['components'].get(self.__class__.__name__) if checkpoint else None
+        if state:
+            self.run_id = state['run_id']
+            self.stores_seen = set(state['stores_seen'])
+            # Events written after the checkpoint belong to uncommitted rows
+            # and are emitted again; a sink rotated in the meantime is kept
+            offset = state.get('sink_offset')
+            if offset is not None and self.sink.tell() > offset:
+                self.sink.truncate(offset)
+                logger.info(f"Resuming change events in {self.changes_uri} at offset {offset}")
+        else:
+            self.run_id = datetime.utcnow().isoformat()
+
+    def checkpoint_saving(self, spider):
+        """Commit the table and return the run id and sink offset for a crawl checkpoint."""
+        if self.db is None:
+            return self.closed_state
+        self.db.commit()
+        self.pending_writes = 0
+        self.sink.flush()
+        return {
+            self.__class__.__name__: {
+                'run_id': self.run_id,
+                'stores_seen': list(self.stores_seen),
+                'sink_offset': self.sink.tell(),
+            }
+        }
+
+    def spider_closed(self, spider, reason):
+        """Emit delisted events after a complete crawl and close resources."""
+        if self.db is None:
+            return
+        # Only a crawl that ran to the end can tell a SKU is gone
+        if reason == 'finished':
+            self._emit_delisted()
+        if self.checkpoint_dir:
+            # The final checkpoint is written after the spider is closed
+            self.closed_state = self.checkpoint_saving(spider)
+        self.db.commit()
+        self.db.close()
+        self.sink.close()
+        self.db = None
+
+    def process_item(self, item, spider):
+        """Compare the item against its stored fingerprint and emit events."""
+        adapter = ItemAdapter(item)
+        sku = adapter.get('sku')
+        if not sku or 'price' not in adapter.field_names():
+            return item
+
+        store = adapter.get('store') or ''
+        self.stores_seen.add(store)
+        volatile_hash = self._fingerprint(adapter, self.VOLATILE_FIELDS)
+        stable_hash = self._fingerprint(adapter, self.STABLE_FIELDS)
+        price = adapter.get('price')
+        special_price = adapter.get('special_price')
+        in_stock = adapter.get('in_stock')
+
+        row = self.db.execute(
+            'SELECT volatile_hash, stable_hash, price, special_price, in_stock, delisted '
+            'FROM sku_state WHERE store = ? AND sku = ?',
+            (store, sku)
+        ).fetchone()
+
+        if row is None:
+            self._emit('new_sku', store, sku, adapter, price=price, in_stock=in_stock)
+        else:
+            old_volatile, old_stable, old_price, old_special, old_in_stock, delisted = row
+            if delisted:
+                self._emit('relisted', store, sku, adapter, price=price, in_stock=in_stock)
+            if old_volatile != volatile_hash:
+                self._emit_volatile_changes(
+                    store, sku, adapter,
+                    (old_price, old_special, old_in_stock),
+                    (price, special_price, in_stock),
+                )
+            if old_stable is not None and old_stable != stable_hash:
+                self._emit('details_changed', store, sku, adapter)
+
+        self.db.execute(
+            'INSERT OR REPLACE INTO sku_state '
+            '(store, sku, url, volatile_hash, stable_hash, price, special_price, in_stock, last_seen, delisted) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)',
+            (store, sku, adapter.get('url'), volatile_hash, stable_hash,
+             price, special_price, None if in_stock is None else int(bool(in_stock)), self.run_id)
+        )
+        self.pending_writes += 1
+        # Checkpointed crawls commit with each checkpoint instead
+        if not self.checkpoint_dir and self.pending_writes >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.pending_writes = 0
+
         return item
-    
-    def _get_image_filename(self, item, url):
-        """Generate a filename for the downloaded image."""
-        # Use item SKU and URL hash to create a unique filename
-        sku = item.get('sku', 'unknown')
-        url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
-        extension = url.split('.')[-1].lower()
-        
-        # Ensure the extension is valid
-        if len(extension) > 5 or '/' in extension or '?' in extension:
-            extension = 'jpg'
-            
-        return f"{sku}_{url_hash[:8]}.{extension}"
+
+    def _emit_volatile_changes(self, store, sku, adapter, old, new):
+        """Emit the events explaining a change of the volatile fingerprint."""
+        old_price, old_special, old_in_stock = old
+        price, special_price, in_stock = new
+        emitted = False
+
+        if (old_price, old_special) != (price, special_price):
+            self._emit(
+                'price_changed', store, sku, adapter,
+                old_price=old_price, price=price,
+                old_special_price=old_special, special_price=special_price,
+            )
+            emitted = True
+        if in_stock is not None and old_in_stock is not None and bool(old_in_stock) != bool(in_stock):
+            self._emit('back_in_stock' if in_stock else 'out_of_stock', store, sku, adapter)
+            emitted = True
+        if not emitted:
+            self._emit('variants_changed', store, sku, adapter, variants=adapter.get('variants'))
+
+    def _emit_delisted(self):
+        """Emit delisted events for SKUs of crawled stores missing from this run."""
+        for store in self.stores_seen:
+            rows = self.db.execute(
+                'SELECT sku, url FROM sku_state '
+                'WHERE store = ? AND last_seen < ? AND delisted = 0',
+                (store, self.run_id)
+            ).fetchall()
+            for sku, url in rows:
+                self._write_event({'event': 'delisted', 'store': store, 'sku': sku, 'url': url})
+            self.db.execute(
+                'UPDATE sku_state SET delisted = 1 WHERE store = ? AND last_seen < ? AND delisted = 0',
+                (store, self.run_id)
+            )
+
+    def _emit(self, event, store, sku, adapter, **fields):
+        self._write_event({'event': event, 'store': store, 'sku': sku, 'url': adapter.get('url'), **fields})
+
+    def _write_event(self, event):
+        event['timestamp'] = datetime.utcnow().isoformat()
+        self.sink.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+        self.stats.inc_value(f"changes/{event['event']}")
+
+    def _fingerprint(self, adapter, fields):
+        """Return an 8-byte digest of the given fields."""
+        data = json.dumps([adapter.get(field) for field in fields], sort_keys=True, default=str)
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=8).digest()
@@ -0,0 +1,74 @@
+import shutil
+import logging
+import tempfile
+from scrapy.core.scheduler import Scheduler
+from scrapy.utils.job import job_dir
+
+logger = logging.getLogger(__name__)
+
+
+class SpillingScheduler(Scheduler):
+    """
+    Scheduler that keeps requests in memory as usual, but can spill the
+    frontier to a disk queue while the crawl is over its memory budget
+    (see ``magento_scraper.extensions.MemoryBudget``).
+
+    Without a JOBDIR the disk queue lives in a temporary directory that is
+    removed when the spider closes.
+    """
+
+    def __init__(self, *args, spill_dir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spill_dir = spill_dir
+        self.spilling = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create scheduler instance from crawler."""
+        spill_dir = None
+        if crawler.settings.getint('MEMORY_BUDGET_MB') and not job_dir(crawler.settings):
+            spill_dir = tempfile.mkdtemp(prefix='magento-spill-')
+
+        scheduler = super().from_crawler(crawler)
+        if spill_dir:
+            scheduler.spill_dir = spill_dir
+            scheduler.dqdir = scheduler._dqdir(spill_dir)
+        return scheduler
+
+    def close(self, reason):
+        """Close the queues and remove the temporary spill directory."""
+        result = super().close(reason)
+        if self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+        return result
+
+    def spill(self):
+        """Move queued in-memory requests to disk and keep new ones there."""
+        self.spilling = True
+        if self.dqs is None:
+            return 0
+
+        moved = 0
+        unserializable = []
+        while True:
+            request = self.mqs.pop()
+            if request is None:
+                break
+            if self._dqpush(request):
+                moved += 1
+            else:
+                unserializable.append(request)
+        for request in unserializable:
+            self._mqpush(request)
+
+        if moved:
+            self.stats.inc_value('scheduler/spilled', moved, spider=self.spider)
+            logger.info(f"Spilled {moved} queued requests to disk")
+        return moved
+
+    def _dqpush(self, request):
+        # A temporary spill queue is only used while over the memory budget;
+        # a user-supplied JOBDIR keeps Scrapy's usual disk-first behaviour.
+        if self.spill_dir and not self.spilling:
+            return False
+        return super()._dqpush(request)
@@ -0,0 +1,222 @@
+import json
+import logging
+from collections import deque
+from pathlib import Path
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from .xpaths import compile_xpath, union_xpath
+
+logger = logging.getLogger(__name__)
+
+
+def _to_text(value):
+    """Return an XPath result (string or element) as normalized text."""
+    if not isinstance(value, str):
+        value = ' '.join(value.itertext())
+    return ' '.join(value.split())
+
+
+class FieldHealth:
+    """Hit counts and recent extraction outcomes of one field of one store."""
+
+    def __init__(self, window=200):
+        self.hits = {}  # query -> pages it matched
+        self.order = []
+        self.queries = ()
+        self.attempts = 0
+        self.found = 0
+        self.recent = deque(maxlen=window)
+        self.collapsed = False
+
+    def ordering(self, queries):
+        """Return ``queries`` ordered by hits, the winner first."""
+        queries = tuple(queries)
+        if queries != self.queries:
+            # First use, or the store's selectors changed
+            self.queries = queries
+            self.order = sorted(queries, key=lambda query: -self.hits.get(query, 0))
+        return self.order
+
+    def hit(self, position):
+        """Count a hit and move the query ahead of any query with fewer hits."""
+        query = self.order[position]
+        self.hits[query] = self.hits.get(query, 0) + 1
+        while position and self.hits[query] > self.hits.get(self.order[position - 1], 0):
+            self.order[position - 1], self.order[position] = query, self.order[position - 1]
+            position -= 1
+
+    def baseline(self):
+        """Found rate before the recent window, or None with too few samples."""
+        attempts = self.attempts - len(self.recent)
+        if attempts < self.recent.maxlen:
+            return None
+        return (self.found - sum(self.recent)) / attempts
+
+    def to_dict(self):
+        return {'hits': self.hits, 'attempts': self.attempts, 'found': self.found}
+
+
+class SelectorHealth:
+    """
+    Learns which entry of a selector fallback list matches a store's theme.
+
+    ``extract`` tries the selector with the most hits first, a single XPath
+    evaluation on most pages; only on a miss is the union of the rest
+    evaluated, and the individual selectors only when that union matched.
+    ``observe`` tracks whether a field was extracted at all and warns when
+    the recent found rate drops well below the earlier one, which usually
+    means the store's theme changed.
+    """
+
+    def __init__(self, window=200, collapse_ratio=0.5, stats=None):
+        self.window = window
+        self.collapse_ratio = collapse_ratio
+        self.stats = stats
+        self.fields = {}  # (store, field) -> FieldHealth
+
+    def _field(self, store, field):
+        health = self.fields.get((store, field))
+        if health is None:
+            health = self.fields[(store, field)] = FieldHealth(self.window)
+        return health
+
+    def _inc(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(f'selector_health/{key}')
+
+    def extract(self, store, field, queries, selector):
+        """
+        Return the values of the first of ``queries`` that matches ``selector``
+        (a parsel selector or response) as a list of normalized strings.
+        """
+        health = self._field(store, field)
+        order = health.ordering(queries)
+        root = getattr(selector, 'selector', selector).root
+
+        values = compile_xpath(order[0])(root)
+        if values:
+            health.hit(0)
+            self._inc('fast_path_hits')
+            return [_to_text(value) for value in values]
+
+        rest = tuple(order[1:])
+        if not rest or not union_xpath(rest)(root):
+            self._inc('misses')
+            return []
+
+        for position, query in enumerate(rest, 1):
+            values = compile_xpath(query)(root)
+            if values:
+                health.hit(position)
+                self._inc('fallback_hits')
+                return [_to_text(value) for value in values]
+        return []
+
+    def observe(self, store, field, found):
+        """Record whether a field was extracted from a page, by any means."""
+        health = self._field(store, field)
+        health.attempts += 1
+        health.found += bool(found)
+        health.recent.append(bool(found))
+        if len(health.recent) < health.recent.maxlen:
+            return
+
+        baseline = health.baseline()
+        if not baseline:
+            return
+        rate = sum(health.recent) / len(health.recent)
+        if rate < baseline * self.collapse_ratio:
+            if not health.collapsed:
+                health.collapsed = True
+                self._inc('collapsed')
+                logger.warning(
+                    f"Extraction of {field} collapsed for store {store}: found on "
+                    f"{rate:.0%} of the last {len(health.recent)} pages, was {baseline:.0%}. "
+                    f"Has the theme changed?"
+                )
+        elif health.collapsed:
+            health.collapsed = False
+            logger.info(f"Extraction of {field} recovered for store {store} ({rate:.0%})")
+
+    def summary(self):
+        """Return one line per field with its found rate and winning selector."""
+        lines = []
+        for (store, field), health in sorted(self.fields.items()):
+            rate = health.found / health.attempts if health.attempts else 0.0
+            winner = health.order[0] if health.order and health.hits else '-'
+            lines.append(f"{store} {field}: found {rate:.0%} of {health.attempts}, fast path {winner}")
+        return '\n'.join(lines)
+
+    def load(self, path):
+        """Load counts saved by ``save``; a missing file starts from scratch."""
+        path = Path(path)
+        if not path.exists():
+            return
+        data = json.loads(path.read_text(encoding='utf-8'))
+        for store, fields in data.items():
+            for field, entry in fields.items():
+                health = self._field(store, field)
+                health.hits = dict(entry.get('hits', {}))
+                health.attempts = entry.get('attempts', 0)
+                health.found = entry.get('found', 0)
+        logger.info(f"Loaded selector health for {len(self.fields)} fields from {path}")
+
+    def save(self, path):
+        """Write the learned counts as JSON."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {}
+        for (store, field), health in sorted(self.fields.items()):
+            data.setdefault(store, {})[field] = health.to_dict()
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(json.dumps(data, indent=1), encoding='utf-8')
+        tmp_path.replace(path)
+
+
+class SelectorHealthMonitor:
+    """
+    Extension that keeps the spider's selector health across runs: restores
+    the learned selector ordering when the spider opens and saves it, with
+    a per-field summary, when it closes.
+    """
+
+    def __init__(self, crawler, path, window=200, collapse_ratio=0.5):
+        self.crawler = crawler
+        self.path = path
+        self.window = window
+        self.collapse_ratio = collapse_ratio
+        self.health = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """Create extension instance from crawler."""
+        settings = crawler.settings
+        path = settings.get('SELECTOR_HEALTH_PATH')
+        if not path:
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            path=path,
+            window=settings.getint('SELECTOR_HEALTH_WINDOW', 200),
+            collapse_ratio=settings.getfloat('SELECTOR_HEALTH_COLLAPSE_RATIO', 0.5),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        """Give the spider a selector health loaded from the last run."""
+        if not hasattr(spider, 'selector_health'):
+            return
+        self.health = SelectorHealth(self.window, self.collapse_ratio, self.crawler.stats)
+        self.health.load(self.path)
+        spider.selector_health = self.health
+
+    def spider_closed(self, spider, reason):
+        """Persist the learned ordering and log how each field fared."""
+        if self.health is None:
+            return
+        self.health.save(self.path)
+        summary = self.health.summary()
+        if summary:
+            logger.info(f"Selector health:\n{summary}")
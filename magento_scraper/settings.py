@@ -18,6 +18,9 @@ RANDOMIZE_DOWNLOAD_DELAY = True  # Add randomness to the delay
 CONCURRENT_REQUESTS_PER_DOMAIN = 2
 CONCURRENT_ITEMS = 100
 
+# Stores to crawl (JSON/YAML, see README); the demo store is used if unset
+STORES_CONFIG = None
+
 # Caching and retry
 HTTPCACHE_ENABLED = True
 HTTPCACHE_EXPIRATION_SECS = 3600  # 1 hour
@@ -37,12 +40,80 @@ AUTOTHROTTLE_START_DELAY = 5.0
 AUTOTHROTTLE_MAX_DELAY = 60.0
 AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
 
+# Parse only the needed regions of product pages (full tree as fallback)
+FRAGMENT_PARSING_ENABLED = True
+
+# Downloader middlewares
+DOWNLOADER_MIDDLEWARES = {
+    'magento_scraper.downloader.DownloadClassMiddleware': 50,
+}
+
+# HTTP/2 where the server negotiates it, keep-alive HTTP/1.1 otherwise
+DOWNLOAD_HANDLERS = {
+    'http': 'magento_scraper.downloader.AdaptiveHTTPDownloadHandler',
+    'https': 'magento_scraper.downloader.AdaptiveHTTPDownloadHandler',
+}
+HTTP2_ENABLED = True
+# Connections per host for each class of request (None: CONCURRENT_REQUESTS_PER_DOMAIN)
+DOWNLOAD_POOL_SIZES = {
+    'page': None,
+    'media': 4,
+}
+# Classes with a download slot of their own per host, e.g. {'media': {'concurrency': 2, 'delay': 0.5}}.
+# Other classes share the host's slot; an extra slot adds to the load on the host.
+DOWNLOAD_CLASS_SLOTS = {}
+
+# Spider middlewares
+SPIDER_MIDDLEWARES = {
+    'magento_scraper.checkpoint.CheckpointMiddleware': 25,
+}
+
+# Crawl checkpoints (rerun with the same CHECKPOINT_DIR to resume a killed crawl)
+CHECKPOINT_DIR = None
+CHECKPOINT_INTERVAL = 30  # Seconds of work that may be redone after a kill
+
 # Item pipelines
 ITEM_PIPELINES = {
     'magento_scraper.pipelines.MagentoScraperPipeline': 300,
-    'scrapy.pipelines.images.ImagesPipeline': 1,
+    'magento_scraper.pipelines.ChangeDetectionPipeline': 400,
+    'magento_scraper.pipelines.CustomImagesPipeline': 1,
 }
 
+# Extensions
+EXTENSIONS = {
+    'magento_scraper.extensions.SamplingProfiler': 500,
+    'magento_scraper.extensions.MemoryBudget': 510,
+    'magento_scraper.categories.CategoryIndex': 520,
+    'magento_scraper.selector_health.SelectorHealthMonitor': 530,
+}
+
+# Selector health: learned fast paths for the selector fallback lists
+SELECTOR_HEALTH_PATH = 'output/selector_health.json'  # None disables persistence
+SELECTOR_HEALTH_WINDOW = 200  # Recent pages compared against the earlier found rate
+SELECTOR_HEALTH_COLLAPSE_RATIO = 0.5  # Warn when the recent rate falls below this share
+
+# Category tree index (set CATEGORY_TREE_PATH to None to disable)
+CATEGORY_TREE_PATH = 'output/category_tree.json'
+CATEGORY_TREE_SMOOTHING = 0.5  # Weight of the latest run in each category's change rate
+
+# Memory budget: backpressure when RSS goes over MEMORY_BUDGET_MB (0 disables)
+MEMORY_BUDGET_MB = 0
+MEMORY_BUDGET_CHECK_INTERVAL = 5.0  # Seconds between RSS checks
+MEMORY_BUDGET_RESUME_RATIO = 0.85  # Resume once RSS is below this share of the budget
+MEMORY_BUDGET_MIN_CONCURRENT_ITEMS = 10  # CONCURRENT_ITEMS while over budget
+MEMORY_BUDGET_MIN_RELEASE = 10.0  # Seconds to crawl before pausing again after a release with nothing in flight
+SCHEDULER = 'magento_scraper.scheduler.SpillingScheduler'
+
+# Sampling profiler (enable with -s PROFILER_ENABLED=True or -a profile=1)
+PROFILER_ENABLED = False
+PROFILER_INTERVAL = 0.01  # Seconds between stack samples
+PROFILER_OUTPUT_DIR = 'profiles'
+PROFILER_TOP_N = 20
+
+# Price/stock change detection (set CHANGES_DB to None to disable)
+CHANGES_DB = 'output/sku_state.db'  # Per-SKU fingerprints
+CHANGES_URI = 'output/changes.jsonl'  # Change event stream
+
 # Images pipeline settings
 IMAGES_STORE = os.path.join(Path.home(), 'scrapy_images')
 IMAGES_URLS_FIELD = 'images'
@@ -51,6 +122,10 @@ IMAGES_THUMBS = {
     'small': (50, 50),
     'big': (270, 270),
 }
+IMAGES_NORMALIZE_URLS = True  # Strip Magento's /cache/<hash>/ path segments
+IMAGES_HASH_DISTANCE = 3  # Max differing bits for two images to count as duplicates
+IMAGES_HASH_WORKERS = 4  # Threads computing perceptual hashes
+IMAGES_HASH_INDEX = 'output/image_hashes.jsonl'  # Persisted hash index
 
 # Logging settings
 LOG_LEVEL = 'INFO'
@@ -66,6 +141,10 @@ AUTOTHROTTLE_DEBUG = False
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = '2.7'
+
+# Same fingerprints as '2.7', without per-request caches; binary dedup set
+REQUEST_FINGERPRINTER_CLASS = 'magento_scraper.dupefilter.CompactRequestFingerprinter'
+DUPEFILTER_CLASS = 'magento_scraper.dupefilter.CompactDupeFilter'
 TWISTED_REACTOR = 'twisted.internet.selectreactor.SelectReactor'
 FEED_EXPORT_ENCODING = 'utf-8'
 
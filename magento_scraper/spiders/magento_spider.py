@@ -9,17 +9,27 @@ from scrapy.exceptions import CloseSpider
 from scrapy.spidermiddlewares.httperror import HttpError
 from twisted.internet.error import TimeoutError, DNSLookupError
 from itemadapter import ItemAdapter
-from ..items import ProductItem, CategoryItem
+from ..items import ProductItem, CategoryItem, extract_price
+from ..fragments import OPTIONS_MARKUP_RE, extract_product_fragments
+from ..stores import StoreConfig, load_stores
+from ..categories import CategoryContexts, CategoryTree, canonical_path
+from ..selector_health import SelectorHealth
+from ..downloader import DEFAULT_CLASS, slot_key
+
+# Label in front of the SKU when a fallback selector matches its whole element
+SKU_LABEL_RE = re.compile(r'^\s*SKU\s*#?\s*:?\s*', re.I)
+
 
 class MagentoSpider(Spider):
     """
-    Spider for scraping products from the Magento demo store.
+    Spider for scraping products from Magento stores.
     Handles category navigation, product listing, and detailed product pages.
+
+    Crawls the Magento demo store by default. Pass ``-a stores=stores.yaml``
+    (or set ``STORES_CONFIG``) to crawl several stores in one process.
     """
     
     name = 'magento'
-    allowed_domains = ['magento.softwaretestingboard.com']
-    start_urls = ['https://magento.softwaretestingboard.com/']
     
     # XPath and CSS selectors
     SELECTORS = {
@@ -46,8 +56,6 @@ class MagentoSpider(Spider):
         'product_description': [
             '//div[contains(@class, "product-info-description")]',
             '//div[contains(@class, "product.attribute.description")]',
-            '//div[contains(@class, "product data items")]',
-            '//div[contains(@class, "product-info-details")]',
             '//div[contains(@class, "product attribute overview")]'
         ],
         'product_details': '//div[contains(@class, "additional-attributes-wrapper")]//tr',
@@ -106,13 +114,116 @@ class MagentoSpider(Spider):
         ],
         'product_availability': '//div[contains(@class, "stock")]/span[contains(@class, "available")]/text()',
     }
+
+    # Meta keys carried over to the next page of a listing; anything else,
+    # e.g. depth, download_slot or retry state, belongs to a single request
+    FORWARDED_META = ('store', 'category_id', 'category_url')
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, stores=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.logger.setLevel(logging.INFO)
         self.processed_urls = set()
+        # Store name -> CategoryTree, persisted by the CategoryIndex extension
+        self.category_trees = {}
+        # Category names and breadcrumbs, referred to by meta['category_id']
+        self.category_contexts = CategoryContexts()
+        # Replaced by the saved state when a JOBDIR is used, see ``state``
+        self._state = {}
+        # Learns the matching entry of each fallback list, see SelectorHealthMonitor
+        self.selector_health = SelectorHealth()
+        if isinstance(stores, (list, tuple)):
+            # StoreConfig objects, e.g. from a mock store
+            self.set_stores(list(stores))
+        else:
+            self.set_stores(load_stores(stores) if stores else [StoreConfig.default()])
         
-    def _extract_parent_category(self, url):
+    @property
+    def state(self):
+        """
+        State kept in a JOBDIR by Scrapy's SpiderState extension. Requests
+        in the JOBDIR queues refer to ``category_contexts`` by id, so the
+        table is stored with it.
+        """
+        self._state['category_contexts'] = self.category_contexts
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        if state.get('category_contexts') is not None:
+            self.category_contexts = state['category_contexts']
+        self._state = state
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """Create spider instance and apply per-store download settings."""
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if 'stores' not in kwargs and crawler.settings.get('STORES_CONFIG'):
+            spider.set_stores(load_stores(crawler.settings.get('STORES_CONFIG')))
+        spider._configure_download_slots(crawler.settings)
+        return spider
+    
+    def set_stores(self, stores):
+        """Set the stores to crawl and derive start URLs and allowed domains."""
+        self.stores = {store.name: store for store in stores}
+        self.default_store = stores[0]
+        self.start_urls = [url for store in stores for url in store.start_urls]
+        self.allowed_domains = sorted({d for store in stores for d in store.allowed_domains})
+        
+    def _configure_download_slots(self, settings):
+        """
+        Give every store host its own politeness settings, and the download
+        classes in ``DOWNLOAD_CLASS_SLOTS`` a slot of their own on each host.
+        All slots share the process-wide request limit, so with several
+        hosts total concurrency is raised to let each host use its
+        allowance. Class slots are extra load on a host the user opted
+        into and are not counted.
+        """
+        per_domain = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')
+        slots = dict(settings.getdict('DOWNLOAD_SLOTS'))
+        class_slots = settings.getdict('DOWNLOAD_CLASS_SLOTS')
+        hosts = set()
+        for store in self.stores.values():
+            for host in store.hosts:
+                hosts.add(host)
+                slot = {}
+                if store.concurrency is not None:
+                    slot['concurrency'] = store.concurrency
+                if store.delay is not None:
+                    slot['delay'] = store.delay
+                if slot:
+                    slots.setdefault(host, {}).update(slot)
+                for download_class, class_slot in class_slots.items():
+                    if download_class != DEFAULT_CLASS:
+                        key = slot_key(host, download_class)
+                        slots[key] = {'concurrency': per_domain, **(class_slot or {}), **slots.get(key, {})}
+
+        if len(hosts) > 1:
+            concurrency = sum(
+                slots.get(host, {}).get('concurrency', per_domain) for host in hosts
+            )
+            if concurrency > settings.getint('CONCURRENT_REQUESTS'):
+                settings.set('CONCURRENT_REQUESTS', concurrency, priority='spider')
+        if slots:
+            settings.set('DOWNLOAD_SLOTS', slots, priority='spider')
+    
+    def start_requests(self):
+        """Start from every store's start URLs, tagging requests with the store."""
+        for store in self.stores.values():
+            for url in store.start_urls:
+                yield Request(url, callback=self.parse, meta={'store': store.name}, dont_filter=True)
+    
+    def _store(self, response):
+        """Return the store configuration a response belongs to."""
+        return self.stores.get(response.meta.get('store'), self.default_store)
+        
+    def category_tree(self, store):
+        """Return the category tree of a store, creating it on first use."""
+        tree = self.category_trees.get(store.name)
+        if tree is None:
+            tree = self.category_trees[store.name] = CategoryTree()
+        return tree
+
+    def _extract_parent_category(self, url, store=None):
         """Extract parent category from URL using a more robust method."""
         parsed = urlparse(url)
         path_parts = [p for p in parsed.path.lower().split('/') if p]
@@ -124,31 +235,27 @@ class MagentoSpider(Spider):
         # The parent category is the directory part of the path (e.g., 'women' in '/women/tops-women.html')
         parent_part = path_parts[-2]
 
-        category_map = {
-            'women': 'Women',
-            'men': 'Men',
-            'gear': 'Gear',
-            'training': 'Training',
-        }
-
-        return category_map.get(parent_part, '')
+        return (store or self.default_store).parent_category(parent_part)
 
     def parse(self, response, **kwargs):
         """
         Parse the main page and extract category links with proper hierarchy.
         """
         self.logger.info(f"Parsing main page: {response.url}")
+        store = self._store(response)
+        selectors = store.selectors(self.SELECTORS)
+        tree = self.category_tree(store)
         
         # Extract main category links
-        for category in response.xpath(self.SELECTORS['category_menu']):
-            category_name = category.xpath(self.SELECTORS['category_name']).get()
+        for category in response.xpath(selectors['category_menu']):
+            category_name = category.xpath(selectors['category_name']).get()
             if not category_name:
                 continue
                 
             category_name = category_name.strip()
             
             # Skip unwanted categories
-            if category_name.lower() in ['home', 'sale']:
+            if store.is_skipped(category_name):
                 continue
             
             # Get the main category URL
@@ -156,37 +263,46 @@ class MagentoSpider(Spider):
             if not category_url:
                 continue
                 
-            category_url = category_url.strip()
+            category_url = response.urljoin(category_url.strip())
             
             # Determine if this is a main category by its name
-            is_main_category = category_name.lower() in ['women', 'men', 'gear', 'training']
+            is_main_category = store.is_main_category(category_name)
             
             if is_main_category:
                 # This is a main category (like Women, Men, Gear)
+                node = tree.add_category(category_url, category_name)
                 main_category_item = CategoryItem(
                     name=category_name,
                     url=category_url,
+                    path=node.path if node else '',
                     parent_category='',
+                    parent_url='',
                     level=0,
+                    store=store.name,
                     timestamp=datetime.utcnow().isoformat()
                 )
                 yield main_category_item
                 
                 # Process subcategories if they exist
-                subcategories = category.xpath(self.SELECTORS['subcategory_menu'])
+                subcategories = category.xpath(selectors['subcategory_menu'])
                 for subcat in subcategories:
                     subcat_name = subcat.xpath('text()').get('').strip()
                     subcat_url = subcat.xpath('@href').get('').strip()
                     
                     if not all([subcat_name, subcat_url]):
                         continue
+                    subcat_url = response.urljoin(subcat_url)
                     
                     # Create subcategory item
+                    node = tree.add_category(subcat_url, subcat_name, parent_url=category_url)
                     subcategory_item = CategoryItem(
                         name=subcat_name,
                         url=subcat_url,
+                        path=node.path if node else '',
                         parent_category=category_name,
-                        level=1,
+                        parent_url=category_url,
+                        level=tree.level(node.path) if node else 1,
+                        store=store.name,
                         timestamp=datetime.utcnow().isoformat()
                     )
                     yield subcategory_item
@@ -196,10 +312,12 @@ class MagentoSpider(Spider):
                         subcat_url,
                         callback=self.parse_category,
                         meta={
-                            'category': subcat_name,  # Current category is the subcategory
-                            'subcategory': '',
-                            'parent_category': category_name,  # Parent is the main category
-                            'breadcrumbs': [category_name, subcat_name]  # Full path
+                            'store': store.name,
+                            'category_id': self.category_contexts.intern(
+                                category=subcat_name,  # Current category is the subcategory
+                                parent_category=category_name,  # Parent is the main category
+                                breadcrumbs=(category_name, subcat_name)  # Full path
+                            )
                         },
                         dont_filter=True
                     )
@@ -209,21 +327,28 @@ class MagentoSpider(Spider):
                     category_url,
                     callback=self.parse_category,
                     meta={
-                        'category': category_name,
-                        'parent_category': '',  # Top-level category has no parent
-                        'breadcrumbs': [category_name]
+                        'store': store.name,
+                        'category_id': self.category_contexts.intern(
+                            category=category_name,  # Top-level category has no parent
+                            breadcrumbs=(category_name,)
+                        )
                     }
                 )
             else:
                 # This is a standalone category (like Tops, Bottoms under Women)
-                parent_category = self._extract_parent_category(category_url)
+                parent_category = self._extract_parent_category(category_url, store)
                 
-                # Create category item
+                # Create category item, placed in the tree by its URL path
+                node = tree.add_category(category_url, category_name)
+                parent = tree.get(node.parent) if node and node.parent else None
                 category_item = CategoryItem(
                     name=category_name,
                     url=category_url,
+                    path=node.path if node else '',
                     parent_category=parent_category,
-                    level=1 if parent_category else 0,
+                    parent_url=parent.url if parent else '',
+                    level=tree.level(node.path) if node else (1 if parent_category else 0),
+                    store=store.name,
                     timestamp=datetime.utcnow().isoformat()
                 )
                 yield category_item
@@ -233,53 +358,12 @@ class MagentoSpider(Spider):
                     category_url,
                     callback=self.parse_category,
                     meta={
-                        'category': category_name,
-                        'subcategory': '',
-                        'parent_category': parent_category if parent_category else '',
-                        'breadcrumbs': [parent_category, category_name] if parent_category else [category_name]
-                    }
-                )
-    
-    def check_nested_categories(self, response):
-        """Check for and process nested subcategories (level 2)."""
-        # Check if there are nested subcategories
-        nested_categories = response.xpath('//div[contains(@class, "categories")]//a')
-        
-        if nested_categories:
-            parent_category = response.meta.get('parent_category', '')
-            subcategory = response.meta.get('subcategory', '')
-            breadcrumbs = response.meta.get('breadcrumbs', [])
-            level = response.meta.get('level', 1) + 1
-            
-            for nested_cat in nested_categories:
-                nested_name = nested_cat.xpath('text()').get('').strip()
-                nested_url = nested_cat.xpath('@href').get('').strip()
-                
-                if not all([nested_name, nested_url]):
-                    continue
-                
-                # Create nested category item
-                nested_item = CategoryItem(
-                    name=nested_name,
-                    url=nested_url,
-                    parent_category=subcategory,
-                    level=level,
-                    timestamp=datetime.utcnow().isoformat()
-                )
-                yield nested_item
-                
-                # Update breadcrumbs for the nested level
-                nested_breadcrumbs = breadcrumbs + [nested_name]
-                
-                # Follow nested category to parse products
-                yield response.follow(
-                    nested_url,
-                    callback=self.parse_category,
-                    meta={
-                        'category': parent_category,
-                        'subcategory': subcategory,
-                        'nested_category': nested_name,
-                        'breadcrumbs': nested_breadcrumbs
+                        'store': store.name,
+                        'category_id': self.category_contexts.intern(
+                            category=category_name,
+                            parent_category=parent_category or '',
+                            breadcrumbs=(parent_category, category_name) if parent_category else (category_name,)
+                        )
                     }
                 )
     
@@ -289,11 +373,15 @@ class MagentoSpider(Spider):
         """
         self.logger.info(f"Parsing category: {response.url}")
 
-        parent_category = response.meta.get('parent_category', '')
-        category = response.meta.get('category', '')
+        store = self._store(response)
+        selectors = store.selectors(self.SELECTORS)
+        category_id = response.meta.get('category_id')
+        # Later pages of a listing belong to the category of the first page
+        category_url = response.meta.get('category_url', response.url)
+        tree = self.category_tree(store)
 
         # Extract product links
-        product_links = response.xpath(self.SELECTORS['product_links'])
+        product_links = response.xpath(selectors['product_links'])
         if not product_links:
             self.logger.warning(f"No products found on category page: {response.url}")
             return
@@ -304,50 +392,110 @@ class MagentoSpider(Spider):
                 continue
             
             product_url = response.urljoin(product_url)
+            # Products listed in several categories are only requested once,
+            # so membership is recorded from the listing
+            tree.add_product(category_url, canonical_path(product_url))
 
             # Follow product link
-            yield Request(
-                product_url,
-                callback=self.parse_product,
-                cb_kwargs={
-                    'parent_category': parent_category,
-                    'category': category
-                }
-            )
+            yield self.product_request(product_url, store, category_id, category_url)
 
         # Handle pagination
-        next_page = response.xpath(self.SELECTORS['next_page']).get()
+        next_page = response.xpath(selectors['next_page']).get()
         if next_page:
+            meta = {key: response.meta[key] for key in self.FORWARDED_META if key in response.meta}
+            meta['category_url'] = category_url
             yield response.follow(
                 next_page,
                 callback=self.parse_category,
-                meta=response.meta,
+                meta=meta,
                 dont_filter=True  # Allow multiple requests to same URL with different meta
             )
 
-    def parse_product(self, response, parent_category=None, category=None):
+    def product_request(self, product_url, store, category_id=None, category_url=None):
+        """
+        Return the request for a product page. Its category context is an
+        id into ``category_contexts`` and the listing URL is the one shared
+        by all products of the listing, so the request holds no data of its own.
+        """
+        return Request(
+            product_url,
+            callback=self.parse_product,
+            meta={'store': store.name, 'category_id': category_id, 'category_url': category_url}
+        )
+
+    def _extract_variants(self, config):
+        """Build one entry per child product from a swatch renderer jsonConfig."""
+        option_labels = {}
+        for attr_id, attr in config.get('attributes', {}).items():
+            for option in attr.get('options', []):
+                option_labels[(attr_id, option.get('id'))] = (attr.get('code'), option.get('label'))
+
+        option_prices = config.get('optionPrices', {})
+        variants = []
+        for product_id, options in config.get('index', {}).items():
+            variant = {'id': product_id}
+            for attr_id, option_id in options.items():
+                code, label = option_labels.get((attr_id, option_id), (None, None))
+                if code:
+                    variant[code] = label
+            amount = option_prices.get(product_id, {}).get('finalPrice', {}).get('amount')
+            if amount is not None:
+                variant['price'] = amount
+            variants.append(variant)
+        return variants
+
+    def parse_product(self, response, parent_category=None, category=None, category_url=None):
         """
         Parse a product page and extract detailed information using embedded JSON data.
+
+        The category comes from ``meta['category_id']``; the keyword arguments
+        are only passed by requests from checkpoints of older versions.
         """
+        if 'category_id' in response.meta:
+            context = self.category_contexts.get(response.meta['category_id'])
+            parent_category, category = context.parent_category, context.category
+            category_url = response.meta.get('category_url')
         self.logger.info(f"Parsing product: {response.url}")
+        self.processed_urls.add(response.url)
+        store = self._store(response)
+        selectors = store.selectors(self.SELECTORS)
         product_item = ProductItem()
+        product_item['store'] = store.name
+        product_item['currency'] = store.currency
         product_item['parent_category'] = parent_category
         product_item['category'] = category
+        product_item['category_url'] = category_url
         product_item['url'] = response.url
 
+        # Parse only the page regions we need, falling back to the full tree
+        page = None
+        if self.settings.getbool('FRAGMENT_PARSING_ENABLED', True):
+            page = extract_product_fragments(response)
+        full_tree = page is None
+        if full_tree:
+            page = response
+
         # Basic details from primary selectors
-        product_item['name'] = response.css('span[data-ui-id="page-title-wrapper"]::text').get('').strip()
-        product_item['sku'] = response.css('div[itemprop="sku"]::text').get('').strip()
-        description_parts = response.css('div.product.attribute.description .value ::text').getall()
+        product_item['name'] = page.css('span[data-ui-id="page-title-wrapper"]::text').get('').strip()
+        product_item['sku'] = page.css('div[itemprop="sku"]::text').get('').strip()
+        description_parts = page.css('div.product.attribute.description .value ::text').getall()
         product_item['description'] = ' '.join(part.strip() for part in description_parts if part.strip())
 
+        # Price boxes carry the raw amounts; oldPrice is only present on sale items
+        final_price = page.xpath('//*[@data-price-type="finalPrice"]/@data-price-amount').get()
+        old_price = page.xpath('//*[@data-price-type="oldPrice"]/@data-price-amount').get()
+        stock = page.xpath('//div[contains(concat(" ", normalize-space(@class), " "), " stock ")]')
+        stock_classes = stock.xpath('@class').get('').split()
+        availability = stock.xpath('.//text()').get('').strip()
+
         images = set()
         colors = set()
         sizes = set()
+        variants = []
 
         # --- Combined JSON Extraction Logic ---
         # Find all x-magento-init scripts and try to parse them
-        scripts = response.xpath('//script[@type="text/x-magento-init"]/text()').getall()
+        scripts = page.xpath('//script[@type="text/x-magento-init"]/text()').getall()
         for script_text in scripts:
             try:
                 data = json.loads(script_text)
@@ -364,6 +512,14 @@ class MagentoSpider(Spider):
                                 if image.get('full'):
                                     images.add(image['full'])
 
+                    prices = config.get('prices', {})
+                    if not final_price:
+                        final_price = prices.get('finalPrice', {}).get('amount')
+                    if not old_price:
+                        old_price = prices.get('oldPrice', {}).get('amount')
+
+                    variants.extend(self._extract_variants(config))
+
                     if 'attributes' in config:
                         for attr in config['attributes'].values():
                             if attr.get('code') == 'color':
@@ -386,19 +542,65 @@ class MagentoSpider(Spider):
             except (json.JSONDecodeError, KeyError) as e:
                 self.logger.debug(f"Could not parse JSON from a script tag on {response.url}: {e}")
 
-        # --- Fallback to XPath if JSON fails ---
-        if not colors:
-            color_labels = response.xpath('|'.join(self.SELECTORS['product_colors'])).getall()
-            colors.update(label.strip() for label in color_labels if label.strip())
+        # --- Fallback to the selector lists (needs the full tree) ---
+        health = self.selector_health
+        if not product_item['sku']:
+            full_tree = True
+            product_item['sku'] = SKU_LABEL_RE.sub('', next(iter(
+                health.extract(store.name, 'product_sku', selectors['product_sku'], response)
+            ), ''))
+        if not product_item['description']:
+            full_tree = True
+            product_item['description'] = ' '.join(
+                health.extract(store.name, 'product_description', selectors['product_description'], response)
+            )
+        if not images:
+            full_tree = True
+            image_urls = health.extract(store.name, 'product_images', selectors['product_images'], response)
+            images.update(response.urljoin(url) for url in image_urls if url)
+        # Simple products have no options; only look for them if the page has option markup
+        if (not colors or not sizes) and OPTIONS_MARKUP_RE.search(response.body):
+            full_tree = True
+            if not colors:
+                colors.update(
+                    label for label in health.extract(store.name, 'product_colors', selectors['product_colors'], response)
+                    if label
+                )
+            if not sizes:
+                sizes.update(
+                    label for label in health.extract(store.name, 'product_sizes', selectors['product_sizes'], response)
+                    if label
+                )
+        self.crawler.stats.inc_value('product_pages/full_tree' if full_tree else 'product_pages/fragments')
 
-        if not sizes:
-            size_labels = response.xpath('|'.join(self.SELECTORS['product_sizes'])).getall()
-            sizes.update(label.strip() for label in size_labels if label.strip())
+        extracted = {
+            'product_sku': product_item['sku'],
+            'product_description': product_item['description'],
+            'product_images': images,
+            'product_colors': colors,
+            'product_sizes': sizes,
+        }
+        for field, value in extracted.items():
+            health.observe(store.name, field, value)
 
         # Assign extracted data to the item
         product_item['images'] = sorted(list(images))
         product_item['colors'] = sorted(list(colors))
         product_item['sizes'] = sorted(list(sizes))
+        product_item['variants'] = sorted(variants, key=lambda variant: variant['id'])
+
+        price = extract_price(final_price)
+        regular_price = extract_price(old_price)
+        product_item['price'] = price
+        if regular_price is not None and price is not None and regular_price > price:
+            product_item['regular_price'] = regular_price
+            product_item['special_price'] = price
+        else:
+            product_item['regular_price'] = price
+            product_item['special_price'] = None
+        if stock_classes:
+            product_item['in_stock'] = 'available' in stock_classes
+            product_item['availability'] = availability
         
         product_item.setdefault('timestamp', datetime.now().isoformat())
         product_item.setdefault('spider', self.name)
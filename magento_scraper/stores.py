@@ -0,0 +1,126 @@
+import json
+import logging
+from pathlib import Path
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class StoreConfig:
+    """
+    Configuration for one Magento storefront or store view: where to start,
+    how its category URLs map to top-level categories, its currency and any
+    selector overrides for its theme.
+    """
+
+    # Keys of a stores config entry besides name and start_urls
+    OPTIONAL_KEYS = (
+        'categories', 'currency', 'selectors', 'allowed_domains', 'skip_categories', 'concurrency', 'delay',
+    )
+
+    def __init__(self, name, start_urls, categories=None, currency='USD',
+                 selectors=None, allowed_domains=None, skip_categories=None,
+                 concurrency=None, delay=None):
+        if not start_urls:
+            raise ValueError(f"Store '{name}' has no start_urls")
+        self.name = name
+        self.start_urls = list(start_urls)
+        # URL path segment -> display name of the top-level category
+        self.categories = dict(categories or {})
+        self.currency = currency
+        self.selector_overrides = dict(selectors or {})
+        self.allowed_domains = list(allowed_domains or self.hosts)
+        self.skip_categories = [c.lower() for c in (skip_categories or ['home', 'sale'])]
+        self.concurrency = concurrency
+        self.delay = delay
+        self._main_categories = {v.lower() for v in self.categories.values()}
+        self._merged_selectors = None
+
+    @classmethod
+    def default(cls):
+        """The Magento demo store this project was written against."""
+        return cls(
+            name='luma',
+            start_urls=['https://magento.softwaretestingboard.com/'],
+            categories={
+                'women': 'Women',
+                'men': 'Men',
+                'gear': 'Gear',
+                'training': 'Training',
+            },
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a store from one entry of a stores config file."""
+        data = dict(data)
+        try:
+            name = data.pop('name')
+            start_urls = data.pop('start_urls')
+        except KeyError as e:
+            raise ValueError(f"Store config is missing required key {e}") from None
+        unknown = sorted(set(data) - set(cls.OPTIONAL_KEYS))
+        if unknown:
+            raise ValueError(f"Store '{name}' has unknown config keys: {', '.join(unknown)}")
+        return cls(name, start_urls, **data)
+
+    @property
+    def hosts(self):
+        """Hostnames of the store's start URLs."""
+        return sorted({urlparse(url).hostname for url in self.start_urls})
+
+    def selectors(self, defaults):
+        """Return ``defaults`` with this store's overrides applied."""
+        if not self.selector_overrides:
+            return defaults
+        # Merged once per store, not once per response
+        if self._merged_selectors is None or self._merged_selectors[0] is not defaults:
+            self._merged_selectors = (defaults, {**defaults, **self.selector_overrides})
+        return self._merged_selectors[1]
+
+    def is_main_category(self, name):
+        """Return True if ``name`` is one of the store's top-level categories."""
+        return name.lower() in self._main_categories
+
+    def is_skipped(self, name):
+        """Return True if a menu entry should not be crawled."""
+        return name.lower() in self.skip_categories
+
+    def parent_category(self, url_segment):
+        """Map a URL path segment (e.g. 'women') to its top-level category name."""
+        return self.categories.get(url_segment, '')
+
+    def __repr__(self):
+        return f"<StoreConfig {self.name}>"
+
+
+def load_stores(path):
+    """
+    Load store configurations from a JSON or YAML file holding either a
+    list of stores or a mapping with a ``stores`` list.
+    """
+    path = Path(path)
+    text = path.read_text(encoding='utf-8')
+
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("PyYAML is required for YAML store configs: pip install pyyaml") from None
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+
+    if isinstance(data, dict):
+        data = data.get('stores', [])
+
+    stores = [StoreConfig.from_dict(entry) for entry in data]
+    if not stores:
+        raise ValueError(f"No stores defined in {path}")
+
+    names = [store.name for store in stores]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Duplicate store names in {path}")
+
+    logger.info(f"Loaded {len(stores)} store(s) from {path}: {', '.join(names)}")
+    return stores
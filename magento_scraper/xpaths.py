@@ -0,0 +1,15 @@
+from functools import lru_cache
+from lxml import etree
+
+
+@lru_cache(maxsize=None)
+def compile_xpath(query):
+    """Compile an XPath expression once per process."""
+    return etree.XPath(query, smart_strings=False)
+
+
+@lru_cache(maxsize=None)
+def union_xpath(queries):
+    """Return the compiled union of a tuple of XPath expressions."""
+    return compile_xpath('|'.join(queries))
+
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Crawl a local mock store as fast as it serves, without writing outside the work directory
+CRAWL_SETTINGS = {
+    'HTTPCACHE_ENABLED': False,
+    'AUTOTHROTTLE_ENABLED': False,
+    'DOWNLOAD_DELAY': 0,
+    'LOG_LEVEL': 'INFO',
+    # Listings of large mock catalogs run deeper than DEPTH_LIMIT pages
+    'DEPTH_LIMIT': 0,
+}
+
+
+def child_env():
+    """Environment for child processes that import magento_scraper from this checkout."""
+    path = os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')]))
+    return dict(os.environ, PYTHONPATH=path)
+
+
+@pytest.fixture
+def run_json(tmp_path):
+    """
+    Return a function that runs ``python -m magento_scraper`` with the given
+    arguments in ``tmp_path`` and returns the JSON on its last output line.
+    """
+    def run(*args):
+        command = [sys.executable, '-m', 'magento_scraper', *args]
+        output = subprocess.run(command, cwd=tmp_path, env=child_env(), capture_output=True, text=True, check=True)
+        return json.loads(output.stdout.splitlines()[-1])
+
+    return run
+
+
+@pytest.fixture
+def crawl(tmp_path):
+    """
+    Return a function that starts ``python -m magento_scraper`` against a
+    running ``MockStore`` in a child process, with ``tmp_path`` as its
+    working directory, so it can be killed like a real crawl.
+    """
+    processes = []
+    logs = []
+
+    def start(store, settings=None, *args):
+        stores = tmp_path / 'stores.json'
+        config = store.store_config()
+        stores.write_text(json.dumps([{
+            'name': config.name,
+            'start_urls': config.start_urls,
+            'categories': config.categories,
+        }]))
+        command = [sys.executable, '-m', 'magento_scraper', '--stores', str(stores), '--no-images', *args]
+        for name, value in {**CRAWL_SETTINGS, **(settings or {})}.items():
+            command += ['-s', f'{name}={value}']
+        log = open(tmp_path / f'crawl-{len(processes)}.log', 'wb')
+        logs.append(log)
+        process = subprocess.Popen(command, cwd=tmp_path, env=child_env(), stdout=subprocess.PIPE, stderr=log)
+        processes.append(process)
+        return process
+
+    yield start
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    for log in logs:
+        log.close()
+
@@ -0,0 +1,94 @@
+import pytest
+from magento_scraper.categories import CategoryTree
+
+BASE = 'https://shop.test'
+
+
+def build_tree():
+    tree = CategoryTree(smoothing=0.5)
+    tree.add_category(f'{BASE}/women.html', 'Women')
+    tree.add_category(f'{BASE}/men.html', 'Men')
+    tree.add_category(f'{BASE}/women/tops-women.html', 'Tops', parent_url=f'{BASE}/women.html')
+    # No parent given: the URL's directory is the parent
+    tree.add_category(f'{BASE}/men/tops-men.html', 'Tops')
+    return tree
+
+
+def test_same_named_categories_stay_under_their_parents():
+    tree = build_tree()
+    assert len(tree) == 4
+    assert tree.roots() == ['men', 'women']
+    assert tree.get('women/tops-women').parent == 'women'
+    assert tree.get('men/tops-men').parent == 'men'
+    assert tree.get('women').children == {'women/tops-women'}
+    assert tree.get('men').children == {'men/tops-men'}
+    assert tree.level('men/tops-men') == 1
+
+
+def test_a_new_parent_moves_the_category():
+    tree = build_tree()
+    tree.add_category(f'{BASE}/women/tops-women.html', 'Tops', parent_url=f'{BASE}/men.html')
+    assert tree.get('women').children == set()
+    assert tree.get('men').children == {'men/tops-men', 'women/tops-women'}
+
+
+def test_complete_run_updates_the_change_rate():
+    tree = build_tree()
+    for product in 'abcd':
+        tree.add_product(f'{BASE}/women/tops-women.html?p=2', product)
+    tree.add_product(f'{BASE}/men/tops-men.html', 'x')
+    tree.finish_run()
+    # First sighting, nothing to compare against
+    assert tree.get('women/tops-women').change_rate == 0.0
+
+    tree.start_run()
+    for product in 'abce':
+        tree.add_product(f'{BASE}/women/tops-women.html', product)
+    tree.finish_run(complete=True)
+    # d left and e joined: 2 of 5 memberships changed, smoothed by half
+    assert tree.get('women/tops-women').change_rate == pytest.approx(0.2)
+    assert tree.products('women/tops-women', recursive=False) == set('abce')
+    # Not visited this run: last run's membership is kept
+    assert tree.get('men/tops-men').change_rate == 0.0
+    assert tree.products('men/tops-men') == {'x'}
+
+
+def test_incomplete_run_adds_to_the_membership():
+    tree = build_tree()
+    for product in 'abcd':
+        tree.add_product(f'{BASE}/women/tops-women.html', product)
+    tree.finish_run()
+
+    tree.start_run()
+    tree.add_product(f'{BASE}/women/tops-women.html', 'e')
+    tree.finish_run(complete=False)
+    assert tree.get('women/tops-women').change_rate == 0.0
+    assert tree.products('women/tops-women') == set('abcde')
+
+
+def test_recrawl_candidates_rank_subtrees_by_expected_changes():
+    tree = build_tree()
+    tree.add_category(f'{BASE}/gear.html', 'Gear')
+    for product in 'abcd':
+        tree.add_product(f'{BASE}/women/tops-women.html', product)
+    tree.add_product(f'{BASE}/men/tops-men.html', 'x')
+    tree.add_product(f'{BASE}/men/tops-men.html', 'y')
+    tree.add_product(f'{BASE}/gear.html', 'z')
+    tree.get('women/tops-women').change_rate = 0.2  # 0.8 expected changes
+    tree.get('men/tops-men').change_rate = 0.5  # 1.0 expected changes
+
+    assert tree.recrawl_candidates(limit=2) == ['men/tops-men', 'men']
+    # Gear never changed and is not a candidate
+    assert tree.recrawl_candidates() == ['men/tops-men', 'men', 'women/tops-women', 'women']
+
+
+def test_tree_survives_to_dict_and_from_dict():
+    tree = build_tree()
+    tree.add_product(f'{BASE}/women/tops-women.html', 'a')
+    tree.get('women/tops-women').change_rate = 0.25
+
+    restored = CategoryTree.from_dict(tree.to_dict())
+    assert restored.to_dict() == tree.to_dict()
+    assert restored.get('women').children == {'women/tops-women'}
+    assert restored.level('women/tops-women') == 1
+    assert restored.products('women') == {'a'}
@@ -0,0 +1,52 @@
+import json
+import time
+from pathlib import Path
+from magento_scraper.checkpoint import load_checkpoint
+from magento_scraper.mockstore import MockCatalog, MockStore
+
+
+def exported_products(directory):
+    """Return the products in the single export file of MagentoScraperPipeline."""
+    files = list((Path(directory) / 'output').glob('magento_*.jsonl'))
+    assert len(files) == 1, files
+    return [item for item in json.loads(files[0].read_text(encoding='utf-8')) if 'sku' in item]
+
+
+def wait_for_checkpoint(directory, exported, timeout=60):
+    """Wait until a checkpoint covers at least ``exported`` items and return it."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = load_checkpoint(directory)
+        pipeline = state and state['components'].get('MagentoScraperPipeline')
+        if pipeline and len(pipeline['seen_urls']) >= exported:
+            return state
+        time.sleep(0.1)
+    raise AssertionError(f"No checkpoint with {exported} exported items after {timeout}s")
+
+
+def test_killed_crawl_resumes_with_every_product_once(tmp_path, crawl):
+    catalog = MockCatalog(products=400)
+    settings = {
+        'CHECKPOINT_DIR': tmp_path / 'checkpoint',
+        'CHECKPOINT_INTERVAL': 1,
+        'CONCURRENT_REQUESTS': 8,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
+    }
+    with MockStore(catalog, latency=0.1) as store:
+        first = crawl(store, settings)
+        state = wait_for_checkpoint(settings['CHECKPOINT_DIR'], exported=150)
+        # Kill between checkpoints, with items written after the last one
+        time.sleep(0.5)
+        first.kill()
+        first.wait()
+        assert not state['finished'] and state['frontier']
+
+        second = crawl(store, settings)
+        assert second.wait(timeout=120) == 0
+
+    skus = [product['sku'] for product in exported_products(tmp_path)]
+    assert sorted(skus) == [catalog.product(i)['sku'] for i in range(catalog.size)]
+    # Events written after the last checkpoint are emitted again, not twice
+    events = (tmp_path / 'output' / 'changes.jsonl').read_text(encoding='utf-8').splitlines()
+    assert sorted(json.loads(event)['sku'] for event in events) == sorted(skus)
+    assert load_checkpoint(settings['CHECKPOINT_DIR']) is None  # marked finished
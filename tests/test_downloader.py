@@ -0,0 +1,70 @@
+import pytest
+from OpenSSL import SSL
+from scrapy import Request
+from scrapy.core.http2.protocol import InvalidNegotiatedProtocol
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import ConnectionLost, ConnectionRefusedError, DNSLookupError, TimeoutError
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseFailed
+from scrapy.settings import Settings
+from magento_scraper.downloader import AdaptiveHTTPDownloadHandler, DownloadClassMiddleware, is_http2_negotiation_error
+from magento_scraper.spiders.magento_spider import MagentoSpider
+from magento_scraper.stores import StoreConfig
+
+
+@pytest.mark.parametrize('error, expected', [
+    (ResponseFailed([InvalidNegotiatedProtocol(b'http/1.1'), Failure(ConnectionLost())]), True),
+    (ResponseFailed([Failure(SSL.Error([('SSL routines', '', 'tlsv1 alert no application protocol')]))]), True),
+    (ResponseFailed([Failure(ConnectionLost())]), False),
+    (ConnectionRefusedError(), False),
+    (TimeoutError(), False),
+    (DNSLookupError(), False),
+])
+def test_http2_negotiation_errors(error, expected):
+    assert is_http2_negotiation_error(Failure(error)) is expected
+
+
+def test_other_http2_failures_are_left_to_retries():
+    handler = AdaptiveHTTPDownloadHandler.from_crawler(get_crawler())
+    failure = Failure(ConnectionRefusedError())
+    request = Request('https://shop.test/')
+    assert handler._h2_failed(failure, request, None, 'page', 'shop.test') is failure
+    assert 'shop.test' not in handler.h1_hosts
+
+
+def configured_slots(**settings):
+    """Return the project settings after the spider configured a single store's slots."""
+    project = Settings()
+    project.setmodule('magento_scraper.settings', priority='project')
+    project.update(settings)
+    spider = MagentoSpider(stores=[StoreConfig('shop', ['https://shop.test/'])])
+    spider._configure_download_slots(project)
+    return project
+
+
+def test_media_shares_the_host_slot_by_default():
+    settings = configured_slots()
+    assert settings.getint('CONCURRENT_REQUESTS') == 2
+    assert 'shop.test|media' not in settings.getdict('DOWNLOAD_SLOTS')
+
+    request = Request('https://shop.test/image.jpg', meta={'download_class': 'media'})
+    DownloadClassMiddleware(settings.getdict('DOWNLOAD_CLASS_SLOTS')).process_request(request, None)
+    assert 'download_slot' not in request.meta
+
+
+def test_media_slot_is_opt_in_and_does_not_raise_total_concurrency():
+    settings = configured_slots(DOWNLOAD_CLASS_SLOTS={'media': {'concurrency': 1, 'delay': 0.5}})
+    assert settings.getint('CONCURRENT_REQUESTS') == 2
+    assert settings.getdict('DOWNLOAD_SLOTS')['shop.test|media'] == {'concurrency': 1, 'delay': 0.5}
+
+    request = Request('https://shop.test/image.jpg', meta={'download_class': 'media'})
+    DownloadClassMiddleware(settings.getdict('DOWNLOAD_CLASS_SLOTS')).process_request(request, None)
+    assert request.meta['download_slot'] == 'shop.test|media'
+
+
+@pytest.mark.parametrize('options', [[], ['-m', 'no_http2=true']])
+def test_tls_store_is_crawled_with_or_without_http2(run_json, options):
+    stats = run_json('--mock-store', '100', '-m', 'tls=true', *options, '--no-images', '--benchmark',
+                     '-s', 'LOG_LEVEL=WARNING')
+    assert stats['products'] == 100
+    assert set(stats['status_counts']) == {'200'}
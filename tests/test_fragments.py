@@ -0,0 +1,6 @@
+def test_mock_product_pages_parse_from_fragments_alone(run_json):
+    # Every page, simple products without swatches included, stays on the fast path
+    result = run_json('--parse-benchmark', '300', '-s', 'LOG_LEVEL=WARNING')
+    assert result['fragment_pages'] == 300
+    assert result['full_tree_pages'] == 0
+    assert result['same_items']
@@ -0,0 +1,108 @@
+from io import BytesIO
+import pytest
+from scrapy import Spider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from magento_scraper.imagededup import ImageHashIndex, normalize_image_url
+from magento_scraper.images import CustomImagesPipeline
+
+STORED = 0x0123456789abcdef
+COPY_URL = 'https://shop.test/media/catalog/product/w/b/wb04-blue_alt1.jpg'
+
+
+@pytest.mark.parametrize('url, expected', [
+    # Magento 2
+    ('https://shop.test/media/catalog/product/cache/0f831c1845fc143d00d6d1ebc49f446a/w/b/wb04-blue-0.jpg',
+     'https://shop.test/media/catalog/product/w/b/wb04-blue-0.jpg'),
+    # Magento 1, with and without a size
+    ('https://shop.test/media/catalog/product/cache/1/image/265x/9df78eab33525d08d6e5fb8d27136e95/w/b/wb04.jpg',
+     'https://shop.test/media/catalog/product/w/b/wb04.jpg'),
+    ('https://shop.test/media/catalog/product/cache/1/small_image/9df78eab33525d08d6e5fb8d27136e95/w/b/wb04.jpg',
+     'https://shop.test/media/catalog/product/w/b/wb04.jpg'),
+    ('https://shop.test/media/catalog/product/w/b/wb04.jpg', 'https://shop.test/media/catalog/product/w/b/wb04.jpg'),
+])
+def test_normalize_image_url(url, expected):
+    assert normalize_image_url(url) == expected
+
+
+def test_hash_index_finds_near_duplicates_of_the_same_colour():
+    index = ImageHashIndex(max_distance=3)
+    info = {'path': 'full/01/stored.jpg', 'checksum': 'c0ffee'}
+    index.add((5, STORED), info)
+
+    assert index.find((5, STORED)) is info
+    # Three bits in three bands: the fourth band still matches exactly
+    assert index.find((5, STORED ^ (1 | 1 << 16 | 1 << 32))) is info
+    assert index.find((5, STORED ^ (1 | 1 << 16 | 1 << 32 | 1 << 48))) is None
+    # A colour variant of the same shot
+    assert index.find((6, STORED)) is None
+
+
+def test_hash_index_survives_save_and_load(tmp_path):
+    index = ImageHashIndex()
+    index.add((5, STORED), {'path': 'full/01/stored.jpg', 'checksum': 'c0ffee'})
+    index.add_url(COPY_URL, {'path': 'full/01/stored.jpg', 'checksum': 'c0ffee'})
+    index.save(tmp_path / 'hashes.jsonl')
+
+    restored = ImageHashIndex()
+    restored.load(tmp_path / 'hashes.jsonl')
+    assert restored.entries == index.entries
+    assert restored.urls == index.urls
+    assert restored.find((5, STORED ^ 1))['path'] == 'full/01/stored.jpg'
+
+
+@pytest.fixture
+def pipeline_and_info(tmp_path):
+    def create():
+        crawler = get_crawler(Spider, settings_dict={
+            'IMAGES_STORE': str(tmp_path / 'images'),
+            'IMAGES_URLS_FIELD': 'images',
+            'IMAGES_HASH_INDEX': str(tmp_path / 'hashes.jsonl'),
+        })
+        spider = crawler._create_spider('test')
+        pipeline = CustomImagesPipeline.from_crawler(crawler)
+        pipeline.hash_index.load(pipeline.hash_index_path)
+        return pipeline, pipeline.SpiderInfo(spider)
+    return create
+
+
+def image_response(pipeline, url, colour):
+    from PIL import Image
+
+    body = BytesIO()
+    Image.new('RGB', (16, 16), colour).save(body, 'PNG')
+    request = pipeline.get_media_requests({'images': [url]}, None)[0]
+    return Response(url, body=body.getvalue(), request=request), request
+
+
+def test_near_duplicate_is_not_downloaded_again(tmp_path, pipeline_and_info):
+    pipeline, info = pipeline_and_info()
+    stored = {'path': 'full/01/stored.jpg', 'checksum': 'c0ffee'}
+    pipeline.hash_index.add((5, STORED), stored)
+    response, request = image_response(pipeline, COPY_URL, 'blue')
+
+    result = pipeline._store_unless_duplicate((5, STORED ^ 1), response, request, info, None)
+    assert result == {'url': COPY_URL, 'path': 'full/01/stored.jpg', 'checksum': 'c0ffee', 'status': 'duplicate'}
+    assert info.spider.crawler.stats.get_value('file_status_count/duplicate') == 1
+    pipeline.hash_index.save(pipeline.hash_index_path)
+
+    # Next run: the copy's request points at the stored image, which is up to date
+    pipeline, info = pipeline_and_info()
+    (tmp_path / 'images' / 'full' / '01').mkdir(parents=True)
+    (tmp_path / 'images' / 'full' / '01' / 'stored.jpg').write_bytes(b'stored')
+    request = pipeline.get_media_requests({'images': [COPY_URL]}, info)[0]
+    results = []
+    pipeline.media_to_download(request, info).addCallback(results.append)
+    assert results[0]['path'] == 'full/01/stored.jpg'
+    assert results[0]['status'] == 'uptodate'
+
+
+def test_former_duplicate_is_stored_under_its_own_name(pipeline_and_info):
+    pipeline, info = pipeline_and_info()
+    pipeline.hash_index.add_url(COPY_URL, {'path': 'full/01/stored.jpg', 'checksum': 'c0ffee'})
+    response, request = image_response(pipeline, COPY_URL, 'red')
+    assert request.meta['filename'] == 'full/01/stored.jpg'
+
+    result = pipeline._store_unless_duplicate((6, STORED), response, request, info, None)
+    assert result['path'] == pipeline._get_image_filename(COPY_URL)
+    assert COPY_URL not in pipeline.hash_index.urls
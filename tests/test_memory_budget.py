@@ -0,0 +1,43 @@
+import json
+from magento_scraper.mockstore import MockCatalog, MockStore
+
+# Checks RSS more often than the engine's 5 s heartbeat
+SETTINGS = {
+    'MEMORY_BUDGET_CHECK_INTERVAL': 0.5,
+    'CONCURRENT_REQUESTS': 32,
+    'CONCURRENT_REQUESTS_PER_DOMAIN': 32,
+    'LOG_LEVEL': 'WARNING',
+}
+
+
+def crawl_stats(crawl, products, budget_mb, timeout=300, latency=0.0, per_page=12, settings=None):
+    """Crawl a mock store of ``products`` under a memory budget and return its throughput stats."""
+    with MockStore(MockCatalog(products=products, per_page=per_page), latency=latency) as store:
+        process = crawl(store, {**SETTINGS, 'MEMORY_BUDGET_MB': budget_mb, **(settings or {})}, '--benchmark')
+        stdout, _ = process.communicate(timeout=timeout)
+    assert process.returncode == 0
+    return json.loads(stdout.splitlines()[-1])
+
+
+def test_budget_below_baseline_rss_still_finishes(crawl):
+    # Always over budget: only the drained release lets the crawl go on
+    stats = crawl_stats(crawl, products=300, budget_mb=1, timeout=120)
+    assert stats['products'] == 300
+
+
+def test_budget_keeps_a_growing_frontier_off_the_heap(crawl):
+    # Slow responses and long listings followed ahead of their products
+    # (no depth priority, LIFO queues) queue the catalog far faster than
+    # it is downloaded, so the frontier grows for the whole crawl
+    soak = {'DEPTH_PRIORITY': 0, 'CLOSESPIDER_TIMEOUT': 40}
+    # A budget this large is never reached but still records the peak RSS
+    unbudgeted = crawl_stats(crawl, products=100000, budget_mb=1 << 20, latency=1.0, per_page=500, settings=soak)
+    # Just over the RSS of a crawl that has only started
+    budgeted = crawl_stats(crawl, products=100000, budget_mb=96, latency=1.0, per_page=500, settings=soak)
+
+    assert unbudgeted['throttled'] == 0
+    assert budgeted['throttled'] > 0
+    assert budgeted['spilled'] > 0
+    # About the same number of pages crawled, for a clearly lower peak
+    assert budgeted['responses'] > unbudgeted['responses'] * 0.8
+    assert budgeted['peak_rss'] < unbudgeted['peak_rss'] * 0.9
@@ -0,0 +1,57 @@
+import json
+import sqlite3
+from scrapy.utils.test import get_crawler
+from magento_scraper.items import ProductItem
+from magento_scraper.pipelines import ChangeDetectionPipeline
+
+
+def product(**fields):
+    item = ProductItem(
+        store='mock', sku='MK0000001', url='http://mock.test/mock-product-1.html', name='Aero Tee 1',
+        description='Breathable tee.', category='Tops', parent_category='Women',
+        colors=['Blue'], sizes=['M'], price=20.0, regular_price=20.0, special_price=None,
+        in_stock=True, variants=[],
+    )
+    item.update(fields)
+    return item
+
+
+def crawl(tmp_path, *items):
+    """Run items through a ChangeDetectionPipeline as one finished crawl and return its events."""
+    crawler = get_crawler(settings_dict={
+        'CHANGES_DB': str(tmp_path / 'sku_state.db'),
+        'CHANGES_URI': str(tmp_path / 'changes.jsonl'),
+    })
+    pipeline = ChangeDetectionPipeline.from_crawler(crawler)
+    events = tmp_path / 'changes.jsonl'
+    start = events.stat().st_size if events.exists() else 0
+    pipeline.open_spider(None)
+    for item in items:
+        pipeline.process_item(item, None)
+    pipeline.spider_closed(None, 'finished')
+    with open(events, encoding='utf-8') as f:
+        f.seek(start)
+        return [json.loads(line)['event'] for line in f]
+
+
+def test_category_of_first_listing_is_not_a_change(tmp_path):
+    assert crawl(tmp_path, product()) == ['new_sku']
+    # Same product reached through its top-level category listing first
+    assert crawl(tmp_path, product(category='Women', parent_category='')) == []
+
+
+def test_price_and_detail_changes_are_reported(tmp_path):
+    crawl(tmp_path, product())
+    assert crawl(tmp_path, product(price=18.0, regular_price=18.0, name='Aero Tee')) == [
+        'price_changed', 'details_changed',
+    ]
+
+
+def test_stable_hashes_of_older_versions_are_not_compared(tmp_path):
+    crawl(tmp_path, product())
+    db = sqlite3.connect(tmp_path / 'sku_state.db')
+    db.execute("UPDATE sku_state SET stable_hash = x'00'")
+    db.execute('PRAGMA user_version = 0')
+    db.commit()
+    db.close()
+    assert crawl(tmp_path, product()) == []
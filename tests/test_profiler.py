@@ -0,0 +1,25 @@
+import re
+from magento_scraper.mockstore import MockCatalog, MockStore
+
+
+def test_profiled_crawl_writes_folded_stacks_and_summary(tmp_path, crawl):
+    with MockStore(MockCatalog(products=600)) as store:
+        process = crawl(store, {'LOG_LEVEL': 'WARNING', 'CONCURRENT_REQUESTS': 16, 'CONCURRENT_REQUESTS_PER_DOMAIN': 16},
+                        '-a', 'profile=1')
+        assert process.wait(timeout=120) == 0
+
+    folded = list((tmp_path / 'profiles').glob('magento_*.folded'))
+    summaries = list((tmp_path / 'profiles').glob('magento_*_summary.txt'))
+    assert len(folded) == 1 and len(summaries) == 1
+
+    # One "<stack> <count>" line per distinct stack, frames as module:function
+    stacks = folded[0].read_text(encoding='utf-8').splitlines()
+    assert all(re.fullmatch(r'\S.* \d+', line) for line in stacks)
+    assert any('magento_scraper.spiders.magento_spider:MagentoSpider.parse_product' in line for line in stacks)
+
+    summary = summaries[0].read_text(encoding='utf-8')
+    stages = summary.split('Time by crawl stage:')[1].split('Top ')[0]
+    # Product pages are attributed to their callback, split by what it was doing
+    assert re.search(r'(callback|selectors|json decoding) \(parse_product\)', stages)
+    assert 'selectors (parse_category)' in stages
+    assert 'idle (waiting for I/O)' in stages
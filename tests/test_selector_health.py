@@ -0,0 +1,89 @@
+from parsel import Selector
+from magento_scraper.selector_health import FieldHealth, SelectorHealth
+
+FIRST = '//p[@class="first"]/text()'
+SECOND = '//p[@class="second"]/text()'
+THIRD = '//p[@class="third"]/text()'
+
+
+def page(*classes):
+    return Selector(text=''.join(f'<p class="{name}">{name} value</p>' for name in classes))
+
+
+def test_hit_moves_a_query_ahead_of_queries_with_fewer_hits():
+    health = FieldHealth()
+    assert health.ordering([FIRST, SECOND, THIRD]) == [FIRST, SECOND, THIRD]
+    health.hit(2)
+    assert health.order == [THIRD, FIRST, SECOND]
+    health.hit(1)
+    # A tie does not overtake
+    assert health.order == [THIRD, FIRST, SECOND]
+    health.hit(1)
+    assert health.order == [FIRST, THIRD, SECOND]
+
+
+def test_ordering_is_rebuilt_from_hits_when_the_queries_change():
+    health = FieldHealth()
+    health.ordering([FIRST, SECOND])
+    health.hit(1)
+    assert health.ordering([FIRST, SECOND, THIRD]) == [SECOND, FIRST, THIRD]
+
+
+def test_extract_learns_the_matching_query():
+    health = SelectorHealth()
+    assert health.extract('shop', 'sku', [FIRST, SECOND], page('second')) == ['second value']
+    assert health.fields[('shop', 'sku')].order[0] == SECOND
+    assert health.extract('shop', 'sku', [FIRST, SECOND], page('first', 'second')) == ['second value']
+
+
+def test_individual_queries_only_run_when_the_union_matches():
+    class Stats:
+        def __init__(self):
+            self.values = {}
+
+        def inc_value(self, key):
+            self.values[key] = self.values.get(key, 0) + 1
+
+    stats = Stats()
+    health = SelectorHealth(stats=stats)
+    assert health.extract('shop', 'sku', [FIRST, SECOND, THIRD], page('other')) == []
+    assert health.extract('shop', 'sku', [FIRST, SECOND, THIRD], page('third')) == ['third value']
+    assert stats.values == {'selector_health/misses': 1, 'selector_health/fallback_hits': 1}
+    assert health.fields[('shop', 'sku')].hits == {THIRD: 1}
+
+
+def test_colours_come_from_the_first_matching_query_only():
+    # Fallback lists pick one theme's markup; they are not merged
+    health = SelectorHealth()
+    selector = page('second', 'third')
+    assert health.extract('shop', 'colors', [FIRST, SECOND, THIRD], selector) == ['second value']
+
+
+def test_observe_warns_on_collapse_and_recovers(caplog):
+    health = SelectorHealth(window=10, collapse_ratio=0.5)
+    for _ in range(20):
+        health.observe('shop', 'sku', True)
+    for _ in range(10):
+        health.observe('shop', 'sku', False)
+    field = health.fields[('shop', 'sku')]
+    assert field.collapsed
+    assert 'Extraction of sku collapsed for store shop' in caplog.text
+    assert caplog.text.count('collapsed for store') == 1
+
+    for _ in range(10):
+        health.observe('shop', 'sku', True)
+    assert not field.collapsed
+
+
+def test_counts_survive_save_and_load(tmp_path):
+    path = tmp_path / 'health' / 'selectors.json'
+    health = SelectorHealth()
+    health.extract('shop', 'sku', [FIRST, SECOND], page('second'))
+    health.observe('shop', 'sku', True)
+    health.save(path)
+
+    restored = SelectorHealth()
+    restored.load(path)
+    assert restored.fields[('shop', 'sku')].to_dict() == {'hits': {SECOND: 1}, 'attempts': 1, 'found': 1}
+    assert restored.fields[('shop', 'sku')].ordering([FIRST, SECOND]) == [SECOND, FIRST]
+    SelectorHealth().load(tmp_path / 'missing.json')
@@ -0,0 +1,46 @@
+from scrapy.extensions.spiderstate import SpiderState
+from magento_scraper.spiders.magento_spider import MagentoSpider
+
+
+def test_category_contexts_survive_a_jobdir_restart(tmp_path):
+    spider = MagentoSpider()
+    SpiderState(str(tmp_path)).spider_opened(spider)
+    women = spider.category_contexts.intern(category='Women', breadcrumbs=('Women',))
+    tops = spider.category_contexts.intern(
+        category='Tops', parent_category='Women', breadcrumbs=('Women', 'Tops'),
+    )
+    SpiderState(str(tmp_path)).spider_closed(spider)
+
+    resumed = MagentoSpider()
+    SpiderState(str(tmp_path)).spider_opened(resumed)
+    assert resumed.category_contexts.get(women).category == 'Women'
+    assert resumed.category_contexts.get(tops).parent_category == 'Women'
+    assert resumed.category_contexts.get(tops).breadcrumbs == ('Women', 'Tops')
+
+
+def parsed_product(body):
+    from scrapy import Request
+    from scrapy.http import HtmlResponse
+    from scrapy.utils.test import get_crawler
+
+    spider = MagentoSpider()
+    spider._set_crawler(get_crawler(MagentoSpider))
+    url = 'http://mock.test/bag.html'
+    response = HtmlResponse(url, body=body, encoding='utf-8', request=Request(url))
+    return next(spider.parse_product(response))
+
+
+def test_sku_fallback_strips_the_label():
+    item = parsed_product(
+        '<html><body><div class="product-info-sku"><span>SKU#: 24-MB01</span></div></body></html>'
+    )
+    assert item['sku'] == '24-MB01'
+
+
+def test_description_fallback_skips_the_tab_container():
+    item = parsed_product(
+        '<html><body><div class="product data items">'
+        '<div class="data item title">Details</div><div class="data item title">Reviews (3)</div>'
+        '</div></body></html>'
+    )
+    assert item['description'] == ''
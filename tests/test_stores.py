@@ -0,0 +1,69 @@
+import json
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+from magento_scraper.spiders.magento_spider import MagentoSpider
+from magento_scraper.stores import StoreConfig, load_stores
+
+EU = {'name': 'eu', 'start_urls': ['https://eu.shop.test/'], 'currency': 'EUR', 'concurrency': 4, 'delay': 0.5}
+US = {'name': 'us', 'start_urls': ['https://us.shop.test/'], 'selectors': {'product_sku': ['//span[@id="code"]/text()']}}
+
+
+def write(tmp_path, data, name='stores.json'):
+    path = tmp_path / name
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return path
+
+
+@pytest.mark.parametrize('data', [[EU, US], {'stores': [EU, US]}])
+def test_load_stores_from_a_list_or_a_mapping(tmp_path, data):
+    stores = load_stores(write(tmp_path, data))
+    assert [store.name for store in stores] == ['eu', 'us']
+    assert stores[0].currency == 'EUR'
+    assert stores[0].allowed_domains == ['eu.shop.test']
+
+
+def test_load_stores_from_yaml(tmp_path):
+    pytest.importorskip('yaml')
+    path = tmp_path / 'stores.yaml'
+    path.write_text('stores:\n  - name: eu\n    start_urls: [https://eu.shop.test/]\n', encoding='utf-8')
+    assert [store.name for store in load_stores(path)] == ['eu']
+
+
+@pytest.mark.parametrize('data, message', [
+    ([EU, EU], 'Duplicate store names'),
+    ({'stores': []}, 'No stores defined'),
+    ([{'name': 'eu'}], "missing required key 'start_urls'"),
+    ([{'name': 'eu', 'start_urls': []}], "Store 'eu' has no start_urls"),
+    ([{**EU, 'concurency': 2, 'proxy': 'x'}], "Store 'eu' has unknown config keys: concurency, proxy"),
+])
+def test_invalid_store_configs(tmp_path, data, message):
+    with pytest.raises(ValueError, match=message):
+        load_stores(write(tmp_path, data))
+
+
+def test_selector_overrides_apply_to_their_store_only():
+    spider = MagentoSpider(stores=[StoreConfig.from_dict(EU), StoreConfig.from_dict(US)])
+    spider._set_crawler(get_crawler(MagentoSpider))
+    body = '<html><body><span id="code">MB01</span></body></html>'
+    skus = {}
+    for store in ('eu', 'us'):
+        url = f'https://{store}.shop.test/bag.html'
+        response = HtmlResponse(url, body=body, encoding='utf-8', request=Request(url, meta={'store': store}))
+        skus[store] = next(spider.parse_product(response))['sku']
+    assert skus == {'eu': '', 'us': 'MB01'}
+
+
+def test_store_delay_and_concurrency_become_download_slots():
+    settings = Settings()
+    settings.setmodule('magento_scraper.settings', priority='project')
+    spider = MagentoSpider(stores=[StoreConfig.from_dict(EU), StoreConfig.from_dict(US)])
+    spider._configure_download_slots(settings)
+
+    slots = settings.getdict('DOWNLOAD_SLOTS')
+    assert slots['eu.shop.test'] == {'concurrency': 4, 'delay': 0.5}
+    assert 'us.shop.test' not in slots
+    # Each host gets its allowance: 4 for eu, CONCURRENT_REQUESTS_PER_DOMAIN for us
+    assert settings.getint('CONCURRENT_REQUESTS') == 4 + settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN')